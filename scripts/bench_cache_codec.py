@@ -0,0 +1,65 @@
+"""
+Microbenchmark: decoding cached API responses with the old msgpack + Pydantic
+round-trip versus ModelCodec.
+
+Run from the repository root:
+
+    python scripts/bench_cache_codec.py
+"""
+import os
+import sys
+import timeit
+import inspect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from data.models import Price, InsiderTrade  # noqa: E402
+from utils.cache import ModelCodec, serialize_pydantic, deserialize_pydantic  # noqa: E402
+
+
+def get_prices() -> list[Price]:
+    pass
+
+
+def get_insider_trades() -> list[InsiderTrade]:
+    pass
+
+
+prices = [
+    Price(open=100 + i, close=101 + i, high=102 + i, low=99 + i, volume=1_000_000 + i, time=f"2024-01-01T{i % 24:02d}:00:00Z")
+    for i in range(5000)
+]
+trades = [
+    InsiderTrade(
+        ticker="AAPL", issuer="Apple Inc", name=f"Insider {i}", title="Director", is_board_director=True,
+        transaction_date="2024-01-02", transaction_shares=100.0 + i, transaction_price_per_share=185.5,
+        transaction_value=18550.0 + i, shares_owned_before_transaction=1000.0, shares_owned_after_transaction=1100.0,
+        security_title="Common Stock", filing_date="2024-01-03",
+    )
+    for i in range(1000)
+]
+
+
+def old_decode(func, data):
+    """What cache_api_response did on every hit before ModelCodec."""
+    return_type = inspect.signature(func).return_annotation
+    return deserialize_pydantic(data, return_type.__args__[0])
+
+
+def bench(name, func, items, number=20):
+    codec = ModelCodec.for_function(func)
+    old_data = serialize_pydantic(items)
+    new_data = codec.encode(items)
+    assert old_decode(func, old_data) == codec.decode(new_data) == items
+
+    old = min(timeit.repeat(lambda: old_decode(func, old_data), number=number, repeat=3)) / number
+    new = min(timeit.repeat(lambda: codec.decode(new_data), number=number, repeat=3)) / number
+    print(f"{name:<22} {len(items):>5} items | "
+          f"old {old * 1000:7.2f} ms, {len(old_data):>7} bytes | "
+          f"new {new * 1000:7.2f} ms, {len(new_data):>7} bytes | "
+          f"{old / new:4.1f}x faster")
+
+
+if __name__ == "__main__":
+    bench("get_prices", get_prices, prices)
+    bench("get_insider_trades", get_insider_trades, trades)
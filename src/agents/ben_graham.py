@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from tools.api import get_financial_metrics, get_market_cap, search_line_items
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
@@ -6,7 +7,7 @@ from pydantic import BaseModel
 import json
 from typing_extensions import Literal
 from utils.progress import progress
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 import math
 
 import logging
@@ -18,6 +19,25 @@ class BenGrahamSignal(BaseModel):
     reasoning: str
 
 
+# Financial line items used for Graham's stability, strength and valuation checks
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "earnings_per_share",
+        "revenue",
+        "net_income",
+        "book_value_per_share",
+        "total_assets",
+        "total_liabilities",
+        "current_assets",
+        "current_liabilities",
+        "dividends_and_other_cash_distributions",
+        "outstanding_shares",
+    ],
+    period="annual",
+    limit=10,
+)
+
+
 def ben_graham_agent(state: AgentState):
     """
     Analyzes stocks using Benjamin Graham's classic value-investing principles:
@@ -38,7 +58,7 @@ def ben_graham_agent(state: AgentState):
         metrics = get_financial_metrics(ticker, end_date, period="annual", limit=10)
 
         progress.update_status("ben_graham_agent", ticker, "Gathering financial line items")
-        financial_line_items = search_line_items(ticker, ["earnings_per_share", "revenue", "net_income", "book_value_per_share", "total_assets", "total_liabilities", "current_assets", "current_liabilities", "dividends_and_other_cash_distributions", "outstanding_shares"], end_date, period="annual", limit=10)
+        financial_line_items = search_line_items(ticker, LINE_ITEM_REQUEST.line_items, end_date, period=LINE_ITEM_REQUEST.period, limit=LINE_ITEM_REQUEST.limit)
 
         progress.update_status("ben_graham_agent", ticker, "Getting market cap")
         market_cap = get_market_cap(ticker, end_date)
@@ -67,6 +87,10 @@ def ben_graham_agent(state: AgentState):
 
         analysis_data[ticker] = {"signal": signal, "score": total_score, "max_score": max_possible_score, "earnings_analysis": earnings_analysis, "strength_analysis": strength_analysis, "valuation_analysis": valuation_analysis}
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("ben_graham_agent", ticker, "Generating Graham-style analysis")
         graham_output = generate_graham_output(
             ticker=ticker,
@@ -79,6 +103,21 @@ def ben_graham_agent(state: AgentState):
 
         progress.update_status("ben_graham_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=BenGrahamSignal,
+            agent_name="ben_graham_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_graham_output,
+        )
+        for ticker, output in outputs.items():
+            graham_analysis[ticker] = output.model_dump()
+            progress.update_status("ben_graham_agent", ticker, "Done")
+
     # Wrap results in a single message for the chain
     message = HumanMessage(content=json.dumps(graham_analysis), name="ben_graham_agent")
 
@@ -277,6 +316,29 @@ def analyze_valuation_graham(metrics: list, financial_line_items: list, market_c
     return {"score": score, "details": "; ".join(details)}
 
 
+SYSTEM_PROMPT = """You are a Benjamin Graham AI agent, making investment decisions using his principles:
+            1. Insist on a margin of safety by buying below intrinsic value (e.g., using Graham Number, net-net).
+            2. Emphasize the company's financial strength (low leverage, ample current assets).
+            3. Prefer stable earnings over multiple years.
+            4. Consider dividend record for extra safety.
+            5. Avoid speculative or high-growth assumptions; focus on proven metrics.
+                        
+            Return a rational recommendation: bullish, bearish, or neutral, with a confidence level (0-100) and concise reasoning.
+            """
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create a Graham-style investment signal.
+
+Return JSON exactly in this format:
+{{
+  "signal": "bullish" or "bearish" or "neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
 def generate_graham_output(
     ticker: str,
     analysis_data: dict[str, any],
@@ -292,30 +354,11 @@ def generate_graham_output(
     template = ChatPromptTemplate.from_messages([
         (
             "system",
-            """You are a Benjamin Graham AI agent, making investment decisions using his principles:
-            1. Insist on a margin of safety by buying below intrinsic value (e.g., using Graham Number, net-net).
-            2. Emphasize the company's financial strength (low leverage, ample current assets).
-            3. Prefer stable earnings over multiple years.
-            4. Consider dividend record for extra safety.
-            5. Avoid speculative or high-growth assumptions; focus on proven metrics.
-                        
-            Return a rational recommendation: bullish, bearish, or neutral, with a confidence level (0-100) and concise reasoning.
-            """
+            SYSTEM_PROMPT + OUTPUT_PROMPT
         ),
         (
             "human",
-            """Based on the following analysis, create a Graham-style investment signal:
-
-            Analysis Data for {ticker}:
-            {analysis_data}
-
-            Return JSON exactly in this format:
-            {{
-              "signal": "bullish" or "bearish" or "neutral",
-              "confidence": float (0-100),
-              "reasoning": "string"
-            }}
-            """
+            "Analysis Data for {ticker}:\n{analysis_data}"
         )
     ])
 
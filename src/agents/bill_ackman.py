@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from tools.api import get_financial_metrics, get_market_cap, search_line_items
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
@@ -6,7 +7,7 @@ from pydantic import BaseModel
 import json
 from typing_extensions import Literal
 from utils.progress import progress
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 
 import logging
 logger = logging.getLogger(__name__)
@@ -17,6 +18,23 @@ class BillAckmanSignal(BaseModel):
     reasoning: str
 
 
+# Financial line items Ackman's quality and discipline analysis reads
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "revenue",
+        "operating_margin",
+        "debt_to_equity",
+        "free_cash_flow",
+        "total_assets",
+        "total_liabilities",
+        "dividends_and_other_cash_distributions",
+        "outstanding_shares",
+    ],
+    period="annual",  # or "ttm" if you prefer trailing 12 months
+    limit=5,          # fetch up to 5 annual periods (or more if needed)
+)
+
+
 def bill_ackman_agent(state: AgentState):
     """
     Analyzes stocks using Bill Ackman's investing principles and LLM reasoning.
@@ -38,19 +56,10 @@ def bill_ackman_agent(state: AgentState):
         # Request multiple periods of data (annual or TTM) for a more robust long-term view.
         financial_line_items = search_line_items(
             ticker,
-            [
-                "revenue",
-                "operating_margin",
-                "debt_to_equity",
-                "free_cash_flow",
-                "total_assets",
-                "total_liabilities",
-                "dividends_and_other_cash_distributions",
-                "outstanding_shares"
-            ],
+            LINE_ITEM_REQUEST.line_items,
             end_date,
-            period="annual",  # or "ttm" if you prefer trailing 12 months
-            limit=5           # fetch up to 5 annual periods (or more if needed)
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
 
         progress.update_status("bill_ackman_agent", ticker, "Getting market cap")
@@ -86,6 +95,10 @@ def bill_ackman_agent(state: AgentState):
             "valuation_analysis": valuation_analysis
         }
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("bill_ackman_agent", ticker, "Generating Ackman analysis")
         ackman_output = generate_ackman_output(
             ticker=ticker,
@@ -102,6 +115,21 @@ def bill_ackman_agent(state: AgentState):
 
         progress.update_status("bill_ackman_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=BillAckmanSignal,
+            agent_name="bill_ackman_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_ackman_output,
+        )
+        for ticker, output in outputs.items():
+            ackman_analysis[ticker] = output.model_dump()
+            progress.update_status("bill_ackman_agent", ticker, "Done")
+
     # Wrap results in a single message for the chain
     message = HumanMessage(
         content=json.dumps(ackman_analysis),
@@ -338,19 +366,7 @@ def analyze_valuation(financial_line_items: list, market_cap: float) -> dict:
     }
 
 
-def generate_ackman_output(
-    ticker: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> BillAckmanSignal:
-    """
-    Generates investment decisions in the style of Bill Ackman.
-    """
-    template = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            """You are a Bill Ackman AI agent, making investment decisions using his principles:
+SYSTEM_PROMPT = """You are a Bill Ackman AI agent, making investment decisions using his principles:
 
             1. Seek high-quality businesses with durable competitive advantages (moats).
             2. Prioritize consistent free cash flow and growth potential.
@@ -366,21 +382,37 @@ def generate_ackman_output(
             - Buy at a discount to intrinsic value; higher discount => stronger conviction.
             - Engage if management is suboptimal or if there's a path for strategic improvements.
             - Provide a rational, data-driven recommendation (bullish, bearish, or neutral)."""
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create an Ackman-style investment signal.
+
+Return the trading signal in this JSON format:
+{{
+  "signal": "bullish/bearish/neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
+def generate_ackman_output(
+    ticker: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+) -> BillAckmanSignal:
+    """
+    Generates investment decisions in the style of Bill Ackman.
+    """
+    template = ChatPromptTemplate.from_messages([
+        (
+            "system",
+            SYSTEM_PROMPT + OUTPUT_PROMPT
         ),
         (
             "human",
-            """Based on the following analysis, create an Ackman-style investment signal.
-
-            Analysis Data for {ticker}:
-            {analysis_data}
-
-            Return the trading signal in this JSON format:
-            {{
-              "signal": "bullish/bearish/neutral",
-              "confidence": float (0-100),
-              "reasoning": "string"
-            }}
-            """
+            "Analysis Data for {ticker}:\n{analysis_data}"
         )
     ])
 
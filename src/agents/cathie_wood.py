@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from tools.api import get_financial_metrics, get_market_cap, search_line_items
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
@@ -6,7 +7,7 @@ from pydantic import BaseModel
 import json
 from typing_extensions import Literal
 from utils.progress import progress
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 
 import logging
 logger = logging.getLogger(__name__)
@@ -17,6 +18,27 @@ class CathieWoodSignal(BaseModel):
     reasoning: str
 
 
+# Financial line items for the disruption, innovation and valuation analysis
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "revenue",
+        "gross_margin",
+        "operating_margin",
+        "debt_to_equity",
+        "free_cash_flow",
+        "total_assets",
+        "total_liabilities",
+        "dividends_and_other_cash_distributions",
+        "outstanding_shares",
+        "research_and_development",
+        "capital_expenditure",
+        "operating_expense",
+    ],
+    period="annual",
+    limit=5,
+)
+
+
 def cathie_wood_agent(state: AgentState):
     """
     Analyzes stocks using Cathie Wood's investing principles and LLM reasoning.
@@ -43,24 +65,10 @@ def cathie_wood_agent(state: AgentState):
         # Request multiple periods of data (annual or TTM) for a more robust view.
         financial_line_items = search_line_items(
             ticker,
-            [
-                "revenue",
-                "gross_margin",
-                "operating_margin",
-                "debt_to_equity",
-                "free_cash_flow",
-                "total_assets",
-                "total_liabilities",
-                "dividends_and_other_cash_distributions",
-                "outstanding_shares",
-                "research_and_development",
-                "capital_expenditure",
-                "operating_expense",
-
-            ],
+            LINE_ITEM_REQUEST.line_items,
             end_date,
-            period="annual",
-            limit=5
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
         logger.debug(type(financial_line_items[0]))
         logger.debug(financial_line_items[0])
@@ -99,6 +107,10 @@ def cathie_wood_agent(state: AgentState):
             "valuation_analysis": valuation_analysis
         }
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("cathie_wood_agent", ticker, "Generating Cathie Wood style analysis")
         cw_output = generate_cathie_wood_output(
             ticker=ticker,
@@ -115,6 +127,21 @@ def cathie_wood_agent(state: AgentState):
 
         progress.update_status("cathie_wood_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=CathieWoodSignal,
+            agent_name="cathie_wood_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_cathie_wood_output,
+        )
+        for ticker, output in outputs.items():
+            cw_analysis[ticker] = output.model_dump()
+            progress.update_status("cathie_wood_agent", ticker, "Done")
+
     message = HumanMessage(
         content=json.dumps(cw_analysis),
         name="cathie_wood_agent"
@@ -434,19 +461,7 @@ def analyze_cathie_wood_valuation(financial_line_items: list, market_cap: float)
     }
 
 
-def generate_cathie_wood_output(
-    ticker: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> CathieWoodSignal:
-    """
-    Generates investment decisions in the style of Cathie Wood.
-    """
-    template = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            """You are a Cathie Wood AI agent, making investment decisions using her principles:\n\n"
+SYSTEM_PROMPT = """You are a Cathie Wood AI agent, making investment decisions using her principles:\n\n"
             "1. Seek companies leveraging disruptive innovation.\n"
             "2. Emphasize exponential growth potential, large TAM.\n"
             "3. Focus on technology, healthcare, or other future-facing sectors.\n"
@@ -459,14 +474,37 @@ def generate_cathie_wood_output(
             "- Check if the company can scale effectively in a large market.\n"
             "- Use a growth-biased valuation approach.\n"
             "- Provide a data-driven recommendation (bullish, bearish, or neutral)."""
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create a Cathie Wood-style investment signal.
+
+Return the trading signal in this JSON format:
+{{
+  "signal": "bullish/bearish/neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
+def generate_cathie_wood_output(
+    ticker: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+) -> CathieWoodSignal:
+    """
+    Generates investment decisions in the style of Cathie Wood.
+    """
+    template = ChatPromptTemplate.from_messages([
+        (
+            "system",
+            SYSTEM_PROMPT + OUTPUT_PROMPT
         ),
         (
             "human",
-            """Based on the following analysis, create a Cathie Wood-style investment signal.\n\n"
-            "Analysis Data for {ticker}:\n"
-            "{analysis_data}\n\n"
-            "Return the trading signal in this JSON format:\n"
-            "{{\n  \"signal\": \"bullish/bearish/neutral\",\n  \"confidence\": float (0-100),\n  \"reasoning\": \"string\"\n}}"""
+            "Analysis Data for {ticker}:\n{analysis_data}"
         )
     ])
 
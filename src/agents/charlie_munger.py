@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from tools.api import get_financial_metrics, get_market_cap, search_line_items, get_insider_trades, get_company_news
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
@@ -6,7 +7,7 @@ from pydantic import BaseModel
 import json
 from typing_extensions import Literal
 from utils.progress import progress
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 
 class CharlieMungerSignal(BaseModel):
     signal: Literal["bullish", "bearish", "neutral"]
@@ -14,6 +15,29 @@ class CharlieMungerSignal(BaseModel):
     reasoning: str
 
 
+# Financial line items used by Munger's moat, management and predictability checks
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "revenue",
+        "net_income",
+        "operating_income",
+        "return_on_invested_capital",
+        "gross_margin",
+        "operating_margin",
+        "free_cash_flow",
+        "capital_expenditure",
+        "cash_and_equivalents",
+        "total_debt",
+        "shareholders_equity",
+        "outstanding_shares",
+        "research_and_development",
+        "goodwill_and_intangible_assets",
+    ],
+    period="annual",
+    limit=10,  # Munger examines long-term trends
+)
+
+
 def charlie_munger_agent(state: AgentState):
     """
     Analyzes stocks using Charlie Munger's investing principles and mental models.
@@ -33,25 +57,10 @@ def charlie_munger_agent(state: AgentState):
         progress.update_status("charlie_munger_agent", ticker, "Gathering financial line items")
         financial_line_items = search_line_items(
             ticker,
-            [
-                "revenue",
-                "net_income",
-                "operating_income",
-                "return_on_invested_capital",
-                "gross_margin",
-                "operating_margin",
-                "free_cash_flow",
-                "capital_expenditure",
-                "cash_and_equivalents",
-                "total_debt",
-                "shareholders_equity",
-                "outstanding_shares",
-                "research_and_development",
-                "goodwill_and_intangible_assets",
-            ],
+            LINE_ITEM_REQUEST.line_items,
             end_date,
-            period="annual",
-            limit=10  # Munger examines long-term trends
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
 
         progress.update_status("charlie_munger_agent", ticker, "Getting market cap")
@@ -120,6 +129,10 @@ def charlie_munger_agent(state: AgentState):
             "news_sentiment": analyze_news_sentiment(company_news) if company_news else "No news data available"
         }
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("charlie_munger_agent", ticker, "Generating Munger analysis")
         munger_output = generate_munger_output(
             ticker=ticker,
@@ -136,6 +149,21 @@ def charlie_munger_agent(state: AgentState):
 
         progress.update_status("charlie_munger_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=CharlieMungerSignal,
+            agent_name="charlie_munger_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_munger_output,
+        )
+        for ticker, output in outputs.items():
+            munger_analysis[ticker] = output.model_dump()
+            progress.update_status("charlie_munger_agent", ticker, "Done")
+
     # Wrap results in a single message for the chain
     message = HumanMessage(
         content=json.dumps(munger_analysis),
@@ -659,19 +687,7 @@ def analyze_news_sentiment(news_items: list) -> str:
     return f"Qualitative review of {len(news_items)} recent news items would be needed"
 
 
-def generate_munger_output(
-    ticker: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> CharlieMungerSignal:
-    """
-    Generates investment decisions in the style of Charlie Munger.
-    """
-    template = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            """You are a Charlie Munger AI agent, making investment decisions using his principles:
+SYSTEM_PROMPT = """You are a Charlie Munger AI agent, making investment decisions using his principles:
 
             1. Focus on the quality and predictability of the business.
             2. Rely on mental models from multiple disciplines to analyze investments.
@@ -693,21 +709,37 @@ def generate_munger_output(
             - Be skeptical of businesses with rapidly changing dynamics or excessive share dilution.
             - Avoid excessive leverage or financial engineering.
             - Provide a rational, data-driven recommendation (bullish, bearish, or neutral)."""
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create a Munger-style investment signal.
+
+Return the trading signal in this JSON format:
+{{
+  "signal": "bullish/bearish/neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
+def generate_munger_output(
+    ticker: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+) -> CharlieMungerSignal:
+    """
+    Generates investment decisions in the style of Charlie Munger.
+    """
+    template = ChatPromptTemplate.from_messages([
+        (
+            "system",
+            SYSTEM_PROMPT + OUTPUT_PROMPT
         ),
         (
             "human",
-            """Based on the following analysis, create a Munger-style investment signal.
-
-            Analysis Data for {ticker}:
-            {analysis_data}
-
-            Return the trading signal in this JSON format:
-            {{
-              "signal": "bullish/bearish/neutral",
-              "confidence": float (0-100),
-              "reasoning": "string"
-            }}
-            """
+            "Analysis Data for {ticker}:\n{analysis_data}"
         )
     ])
 
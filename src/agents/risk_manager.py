@@ -3,6 +3,7 @@ from graph.state import AgentState, show_agent_reasoning
 from utils.progress import progress
 from tools.api import get_prices, prices_to_df_alt
 import json
+import math
 
 import logging
 logger = logging.getLogger(__name__)
@@ -18,25 +19,34 @@ def risk_management_agent(state: AgentState):
     risk_analysis = {}
     current_prices = {}  # Store prices here to avoid redundant API calls
 
+    price_matrix = data.get("price_matrix")
+
     for ticker in tickers:
         progress.update_status("risk_management_agent", ticker, "Analyzing price data")
 
-        prices = get_prices(
-            ticker=ticker,
-            start_date=data["start_date"],
-            end_date=data["end_date"],
-        )
-
-        if not prices:
-            progress.update_status("risk_management_agent", ticker, "Failed: No price data found")
-            continue
-
-        prices_df = prices_to_df_alt(prices)
+        if price_matrix is not None and ticker in price_matrix:
+            # Backtests hand over every ticker's prices preloaded, so this is an array lookup
+            current_price = price_matrix.asof(ticker, data["end_date"])
+            if math.isnan(current_price):  # no bar yet
+                progress.update_status("risk_management_agent", ticker, "Failed: No price data found")
+                continue
+        else:
+            prices = get_prices(
+                ticker=ticker,
+                start_date=data["start_date"],
+                end_date=data["end_date"],
+            )
+
+            if not prices:
+                progress.update_status("risk_management_agent", ticker, "Failed: No price data found")
+                continue
+
+            prices_df = prices_to_df_alt(prices)
+            current_price = prices_df["close"].iloc[-1]
 
         progress.update_status("risk_management_agent", ticker, "Calculating position limits")
 
         # Calculate portfolio value
-        current_price = prices_df["close"].iloc[-1]
         current_prices[ticker] = current_price  # Store the current price
 
         # Calculate current position value for this ticker
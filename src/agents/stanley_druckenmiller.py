@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from tools.api import (
     get_financial_metrics,
     get_market_cap,
@@ -13,7 +14,7 @@ from pydantic import BaseModel
 import json
 from typing_extensions import Literal
 from utils.progress import progress
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 import statistics
 
 
@@ -23,6 +24,32 @@ class StanleyDruckenmillerSignal(BaseModel):
     reasoning: str
 
 
+# Start of the daily prices used for momentum and volatility
+MOMENTUM_START_DATE = "2024-01-01"
+
+# Financial line items for growth, risk-reward and valuation analysis
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "revenue",
+        "earnings_per_share",
+        "net_income",
+        "operating_income",
+        "gross_margin",
+        "operating_margin",
+        "free_cash_flow",
+        "capital_expenditure",
+        "cash_and_equivalents",
+        "total_debt",
+        "shareholders_equity",
+        "outstanding_shares",
+        "ebit",
+        "ebitda",
+    ],
+    period="annual",
+    limit=5,
+)
+
+
 def stanley_druckenmiller_agent(state: AgentState):
     """
     Analyzes stocks using Stanley Druckenmiller's investing principles:
@@ -36,6 +63,7 @@ def stanley_druckenmiller_agent(state: AgentState):
     data = state["data"]
     end_date = data["end_date"]
     tickers = data["tickers"]
+    price_matrix = data.get("price_matrix")
 
     analysis_data = {}
     druck_analysis = {}
@@ -52,25 +80,10 @@ def stanley_druckenmiller_agent(state: AgentState):
         #   - Liquidity: cash_and_equivalents
         financial_line_items = search_line_items(
             ticker,
-            [
-                "revenue",
-                "earnings_per_share",
-                "net_income",
-                "operating_income",
-                "gross_margin",
-                "operating_margin",
-                "free_cash_flow",
-                "capital_expenditure",
-                "cash_and_equivalents",
-                "total_debt",
-                "shareholders_equity",
-                "outstanding_shares",
-                "ebit",
-                "ebitda",
-            ],
+            LINE_ITEM_REQUEST.line_items,
             end_date,
-            period="annual",
-            limit=5,
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Getting market cap")
@@ -83,11 +96,15 @@ def stanley_druckenmiller_agent(state: AgentState):
         company_news = get_company_news(ticker, end_date, start_date=None, limit=50)
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Fetching recent price data for momentum")
-        # Fetch ~1 year of daily prices for momentum/trend analysis
-        prices = get_prices(ticker, start_date="2024-01-01", end_date=end_date)
+        # ~1 year of daily closes for momentum/trend analysis, from the backtest's preloaded prices when they cover it
+        if price_matrix is not None and price_matrix.covers(ticker, MOMENTUM_START_DATE, end_date):
+            close_prices = price_matrix.frame(ticker, MOMENTUM_START_DATE, end_date)["close"].tolist()
+        else:
+            prices = get_prices(ticker, start_date=MOMENTUM_START_DATE, end_date=end_date)
+            close_prices = [p.close for p in sorted(prices, key=lambda p: p.time) if p.close is not None]
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Analyzing growth & momentum")
-        growth_momentum_analysis = analyze_growth_and_momentum(financial_line_items, prices)
+        growth_momentum_analysis = analyze_growth_and_momentum(financial_line_items, close_prices)
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Analyzing sentiment")
         sentiment_analysis = analyze_sentiment(company_news)
@@ -96,7 +113,7 @@ def stanley_druckenmiller_agent(state: AgentState):
         insider_activity = analyze_insider_activity(insider_trades)
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Analyzing risk-reward")
-        risk_reward_analysis = analyze_risk_reward(financial_line_items, market_cap, prices)
+        risk_reward_analysis = analyze_risk_reward(financial_line_items, market_cap, close_prices)
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Performing Druckenmiller-style valuation")
         valuation_analysis = analyze_druckenmiller_valuation(financial_line_items, market_cap)
@@ -133,6 +150,10 @@ def stanley_druckenmiller_agent(state: AgentState):
             "valuation_analysis": valuation_analysis,
         }
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("stanley_druckenmiller_agent", ticker, "Generating Druckenmiller analysis")
         druck_output = generate_druckenmiller_output(
             ticker=ticker,
@@ -149,6 +170,21 @@ def stanley_druckenmiller_agent(state: AgentState):
 
         progress.update_status("stanley_druckenmiller_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=StanleyDruckenmillerSignal,
+            agent_name="stanley_druckenmiller_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_druckenmiller_output,
+        )
+        for ticker, output in outputs.items():
+            druck_analysis[ticker] = output.model_dump()
+            progress.update_status("stanley_druckenmiller_agent", ticker, "Done")
+
     # Wrap results in a single message
     message = HumanMessage(content=json.dumps(druck_analysis), name="stanley_druckenmiller_agent")
 
@@ -159,7 +195,7 @@ def stanley_druckenmiller_agent(state: AgentState):
     return {"messages": [message], "data": state["data"]}
 
 
-def analyze_growth_and_momentum(financial_line_items: list, prices: list) -> dict:
+def analyze_growth_and_momentum(financial_line_items: list, close_prices: list[float]) -> dict:
     """
     Evaluate:
       - Revenue Growth (YoY)
@@ -227,29 +263,24 @@ def analyze_growth_and_momentum(financial_line_items: list, prices: list) -> dic
     # 3. Price Momentum
     #
     # We'll give up to 3 points for strong momentum
-    if prices and len(prices) > 30:
-        sorted_prices = sorted(prices, key=lambda p: p.time)
-        close_prices = [p.close for p in sorted_prices if p.close is not None]
-        if len(close_prices) >= 2:
-            start_price = close_prices[0]
-            end_price = close_prices[-1]
-            if start_price > 0:
-                pct_change = (end_price - start_price) / start_price
-                if pct_change > 0.50:
-                    raw_score += 3
-                    details.append(f"Very strong price momentum: {pct_change:.1%}")
-                elif pct_change > 0.20:
-                    raw_score += 2
-                    details.append(f"Moderate price momentum: {pct_change:.1%}")
-                elif pct_change > 0:
-                    raw_score += 1
-                    details.append(f"Slight positive momentum: {pct_change:.1%}")
-                else:
-                    details.append(f"Negative price momentum: {pct_change:.1%}")
+    if close_prices and len(close_prices) > 30:
+        start_price = close_prices[0]
+        end_price = close_prices[-1]
+        if start_price > 0:
+            pct_change = (end_price - start_price) / start_price
+            if pct_change > 0.50:
+                raw_score += 3
+                details.append(f"Very strong price momentum: {pct_change:.1%}")
+            elif pct_change > 0.20:
+                raw_score += 2
+                details.append(f"Moderate price momentum: {pct_change:.1%}")
+            elif pct_change > 0:
+                raw_score += 1
+                details.append(f"Slight positive momentum: {pct_change:.1%}")
             else:
-                details.append("Invalid start price (<= 0); can't compute momentum.")
+                details.append(f"Negative price momentum: {pct_change:.1%}")
         else:
-            details.append("Insufficient price data for momentum calculation.")
+            details.append("Invalid start price (<= 0); can't compute momentum.")
     else:
         details.append("Not enough recent price data for momentum analysis.")
 
@@ -340,14 +371,14 @@ def analyze_sentiment(news_items: list) -> dict:
     return {"score": score, "details": "; ".join(details)}
 
 
-def analyze_risk_reward(financial_line_items: list, market_cap: float | None, prices: list) -> dict:
+def analyze_risk_reward(financial_line_items: list, market_cap: float | None, close_prices: list[float]) -> dict:
     """
     Assesses risk via:
       - Debt-to-Equity
       - Price Volatility
     Aims for strong upside with contained downside.
     """
-    if not financial_line_items or not prices:
+    if not financial_line_items or not close_prices:
         return {"score": 0, "details": "Insufficient data for risk-reward analysis"}
 
     details = []
@@ -380,32 +411,27 @@ def analyze_risk_reward(financial_line_items: list, market_cap: float | None, pr
     #
     # 2. Price Volatility
     #
-    if len(prices) > 10:
-        sorted_prices = sorted(prices, key=lambda p: p.time)
-        close_prices = [p.close for p in sorted_prices if p.close is not None]
-        if len(close_prices) > 10:
-            daily_returns = []
-            for i in range(1, len(close_prices)):
-                prev_close = close_prices[i - 1]
-                if prev_close > 0:
-                    daily_returns.append((close_prices[i] - prev_close) / prev_close)
-            if daily_returns:
-                stdev = statistics.pstdev(daily_returns)  # population stdev
-                if stdev < 0.01:
-                    raw_score += 3
-                    details.append(f"Low volatility: daily returns stdev {stdev:.2%}")
-                elif stdev < 0.02:
-                    raw_score += 2
-                    details.append(f"Moderate volatility: daily returns stdev {stdev:.2%}")
-                elif stdev < 0.04:
-                    raw_score += 1
-                    details.append(f"High volatility: daily returns stdev {stdev:.2%}")
-                else:
-                    details.append(f"Very high volatility: daily returns stdev {stdev:.2%}")
+    if len(close_prices) > 10:
+        daily_returns = []
+        for i in range(1, len(close_prices)):
+            prev_close = close_prices[i - 1]
+            if prev_close > 0:
+                daily_returns.append((close_prices[i] - prev_close) / prev_close)
+        if daily_returns:
+            stdev = statistics.pstdev(daily_returns)  # population stdev
+            if stdev < 0.01:
+                raw_score += 3
+                details.append(f"Low volatility: daily returns stdev {stdev:.2%}")
+            elif stdev < 0.02:
+                raw_score += 2
+                details.append(f"Moderate volatility: daily returns stdev {stdev:.2%}")
+            elif stdev < 0.04:
+                raw_score += 1
+                details.append(f"High volatility: daily returns stdev {stdev:.2%}")
             else:
-                details.append("Insufficient daily returns data for volatility calc.")
+                details.append(f"Very high volatility: daily returns stdev {stdev:.2%}")
         else:
-            details.append("Not enough close-price data points for volatility analysis.")
+            details.append("Insufficient daily returns data for volatility calc.")
     else:
         details.append("Not enough price data for volatility analysis.")
 
@@ -518,20 +544,7 @@ def analyze_druckenmiller_valuation(financial_line_items: list, market_cap: floa
     return {"score": final_score, "details": "; ".join(details)}
 
 
-def generate_druckenmiller_output(
-    ticker: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> StanleyDruckenmillerSignal:
-    """
-    Generates a JSON signal in the style of Stanley Druckenmiller.
-    """
-    template = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                """You are a Stanley Druckenmiller AI agent, making investment decisions using his principles:
+SYSTEM_PROMPT = """You are a Stanley Druckenmiller AI agent, making investment decisions using his principles:
             
             1. Seek asymmetric risk-reward opportunities (large upside, limited downside).
             2. Emphasize growth, momentum, and market sentiment.
@@ -545,22 +558,39 @@ def generate_druckenmiller_output(
             - Evaluate sentiment and insider activity as supportive or contradictory signals.
             - Watch out for high leverage or extreme volatility that threatens capital.
             - Output a JSON object with signal, confidence, and a reasoning string.
-            """,
+            """
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create a Druckenmiller-style investment signal.
+
+Return the trading signal in this JSON format:
+{{
+  "signal": "bullish/bearish/neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
+def generate_druckenmiller_output(
+    ticker: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+) -> StanleyDruckenmillerSignal:
+    """
+    Generates a JSON signal in the style of Stanley Druckenmiller.
+    """
+    template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                SYSTEM_PROMPT + OUTPUT_PROMPT,
             ),
             (
                 "human",
-                """Based on the following analysis, create a Druckenmiller-style investment signal.
-
-            Analysis Data for {ticker}:
-            {analysis_data}
-
-            Return the trading signal in this JSON format:
-            {{
-              "signal": "bullish/bearish/neutral",
-              "confidence": float (0-100),
-              "reasoning": "string"
-            }}
-            """,
+                "Analysis Data for {ticker}:\n{analysis_data}",
             ),
         ]
     )
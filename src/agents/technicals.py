@@ -50,44 +50,21 @@ def technical_analyst_agent(state: AgentState):
     logger.debug(type(data))
     logger.info("Technical analysis - EOF")
 
-    prices=None
-    # convert_to_date(date_str, fmt="%Y-%m-%d", return_type="str"):
+    # Backtests pass all tickers' prices preloaded
+    price_matrix = data.get("price_matrix")
 
     for ticker in tickers:
         progress.update_status("technical_analyst_agent", ticker, "Analyzing price data")
-        try:
-          logger.info("Getting prices for %s and %s",start_date, end_date)
-          # If using legacy financials client:
-          prices = client.get_prices(
-            ticker=ticker,
-            start_date=start_date,
-            end_date=end_date,
-          )
-        except NotImplementedError:
-          # In case IBKR client is chosen but get_financial_metrics is not supported:
-          print("get_prices is not implemented for this API client.")
-
-        #logger.debug("TA : %s", prices)
-
-        # print dict to file
-        #with open("/home/glenn/repos/ai-hedge-fund/output/tech_analyst_prices.txt", "w", encoding="utf-8") as f:
-        #    f.write(pprint.pformat(prices))
-
-        if not prices:
+        if price_matrix is not None and price_matrix.covers(ticker, start_date, end_date):
+            # Read the ticker's bars straight from the matrix instead of fetching them again
+            prices_df = price_matrix.frame(ticker, start_date, end_date)
+        else:
+            prices_df = fetch_prices_df(client, ticker, start_date, end_date)
+
+        if prices_df is None or prices_df.empty:
             progress.update_status("technical_analyst_agent", ticker, "Failed: No price data found")
             continue
 
-        logger.debug("prices: %s", prices)
-        logger.debug(type(prices))
-        # Convert prices to a DataFrame
-        prices_df = client.prices_to_df_alt(prices)
-
-        logger.debug("prices_df: %s", prices)
-        logger.debug(prices_df)
-        logger.debug(type(prices_df))
-
-        #sys.exit(0)  # Exits with status code 0 (successful termination)
-
         progress.update_status("technical_analyst_agent", ticker, "Calculating trend signals")
         trend_signals = calculate_trend_signals(prices_df)
 
@@ -182,6 +159,29 @@ def technical_analyst_agent(state: AgentState):
     }
 
 
+def fetch_prices_df(client, ticker: str, start_date: str, end_date: str) -> pd.DataFrame | None:
+    """Fetch a ticker's prices from the API client as a DataFrame, None when there are none."""
+    prices = None
+    try:
+      logger.info("Getting prices for %s and %s",start_date, end_date)
+      # If using legacy financials client:
+      prices = client.get_prices(
+        ticker=ticker,
+        start_date=start_date,
+        end_date=end_date,
+      )
+    except NotImplementedError:
+      # In case IBKR client is chosen but get_financial_metrics is not supported:
+      print("get_prices is not implemented for this API client.")
+
+    if not prices:
+        return None
+
+    logger.debug("prices: %s", prices)
+    # Convert prices to a DataFrame
+    return client.prices_to_df_alt(prices)
+
+
 def calculate_trend_signals(prices_df):
     """
     Advanced trend following strategy using multiple timeframes and indicators
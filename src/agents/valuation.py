@@ -1,5 +1,6 @@
 from langchain_core.messages import HumanMessage
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from utils.progress import progress
 import json
 
@@ -8,6 +9,20 @@ from tools.api import get_financial_metrics, get_market_cap, search_line_items
 import logging
 logger = logging.getLogger(__name__)
 
+# Line items needed for owner earnings and DCF valuation
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "free_cash_flow",
+        "net_income",
+        "depreciation_and_amortization",
+        "capital_expenditure",
+        "working_capital",
+    ],
+    period="ttm",
+    limit=2,
+)
+
+
 ##### Valuation Agent #####
 def valuation_agent(state: AgentState):
     """Performs detailed valuation analysis using multiple methodologies for multiple tickers."""
@@ -42,16 +57,10 @@ def valuation_agent(state: AgentState):
         # Fetch the specific line_items that we need for valuation purposes
         financial_line_items = search_line_items(
             ticker=ticker,
-            line_items=[
-                "free_cash_flow",
-                "net_income",
-                "depreciation_and_amortization",
-                "capital_expenditure",
-                "working_capital",
-            ],
+            line_items=LINE_ITEM_REQUEST.line_items,
             end_date=end_date,
-            period="ttm",
-            limit=2,
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
 
         # Add safety check for financial line items
@@ -1,4 +1,5 @@
 from graph.state import AgentState, show_agent_reasoning
+from data.models import LineItemRequest
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
 from pydantic import BaseModel
@@ -9,7 +10,7 @@ from tools.api import (
     get_market_cap,
     search_line_items
 )
-from utils.llm import call_llm
+from utils.llm import call_llm, generate_signals_batched
 from utils.progress import progress
 
 import logging
@@ -21,6 +22,21 @@ class WarrenBuffettSignal(BaseModel):
     reasoning: str
 
 
+# Financial line items for consistency and owner earnings analysis
+LINE_ITEM_REQUEST = LineItemRequest(
+    line_items=[
+        "capital_expenditure",
+        "depreciation_and_amortization",
+        "net_income",
+        "outstanding_shares",
+        "total_assets",
+        "total_liabilities",
+    ],
+    period="ttm",
+    limit=5,
+)
+
+
 def warren_buffett_agent(state: AgentState):
     """Analyzes stocks using Buffett's principles and LLM reasoning."""
     data = state["data"]
@@ -39,17 +55,10 @@ def warren_buffett_agent(state: AgentState):
         progress.update_status("warren_buffett_agent", ticker, "Gathering financial line items")
         financial_line_items = search_line_items(
             ticker,
-            [
-                "capital_expenditure",
-                "depreciation_and_amortization",
-                "net_income",
-                "outstanding_shares",
-                "total_assets",
-                "total_liabilities",
-            ],
+            LINE_ITEM_REQUEST.line_items,
             end_date,
-            period="ttm",
-            limit=5,
+            period=LINE_ITEM_REQUEST.period,
+            limit=LINE_ITEM_REQUEST.limit,
         )
 
         progress.update_status("warren_buffett_agent", ticker, "Getting market cap")
@@ -101,6 +110,10 @@ def warren_buffett_agent(state: AgentState):
             "margin_of_safety": margin_of_safety,
         }
 
+        if state["metadata"].get("batch_llm"):
+            # All tickers are sent to the LLM together after the loop
+            continue
+
         progress.update_status("warren_buffett_agent", ticker, "Generating Buffett analysis")
         buffett_output = generate_buffett_output(
             ticker=ticker,
@@ -118,6 +131,21 @@ def warren_buffett_agent(state: AgentState):
 
         progress.update_status("warren_buffett_agent", ticker, "Done")
 
+    if state["metadata"].get("batch_llm"):
+        outputs = generate_signals_batched(
+            tickers=tickers,
+            analysis_data=analysis_data,
+            system_prompt=SYSTEM_PROMPT,
+            signal_model=WarrenBuffettSignal,
+            agent_name="warren_buffett_agent",
+            model_name=state["metadata"]["model_name"],
+            model_provider=state["metadata"]["model_provider"],
+            generate_one=generate_buffett_output,
+        )
+        for ticker, output in outputs.items():
+            buffett_analysis[ticker] = output.model_dump()
+            progress.update_status("warren_buffett_agent", ticker, "Done")
+
     # Create the message
     message = HumanMessage(content=json.dumps(buffett_analysis), name="warren_buffett_agent")
 
@@ -289,18 +317,7 @@ def calculate_intrinsic_value(financial_line_items: list) -> dict[str, any]:
     }
 
 
-def generate_buffett_output(
-    ticker: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> WarrenBuffettSignal:
-    """Get investment decision from LLM with Buffett's principles"""
-    template = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                """You are a Warren Buffett AI agent. Decide on investment signals based on Warren Buffett’s principles:
+SYSTEM_PROMPT = """You are a Warren Buffett AI agent. Decide on investment signals based on Warren Buffett’s principles:
 
                 Circle of Competence: Only invest in businesses you understand
                 Margin of Safety: Buy well below intrinsic value
@@ -316,22 +333,37 @@ def generate_buffett_output(
                 - Avoid high debt or poor management
                 - Hold good businesses long term
                 - Sell when fundamentals deteriorate or the valuation is too high
-                """,
+                """
+
+
+OUTPUT_PROMPT = """
+Based on the analysis data for the ticker in the next message, create the investment signal as Warren Buffett would.
+
+Return the trading signal in the following JSON format:
+{{
+  "signal": "bullish/bearish/neutral",
+  "confidence": float (0-100),
+  "reasoning": "string"
+}}
+"""
+
+
+def generate_buffett_output(
+    ticker: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+) -> WarrenBuffettSignal:
+    """Get investment decision from LLM with Buffett's principles"""
+    template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                SYSTEM_PROMPT + OUTPUT_PROMPT,
             ),
             (
                 "human",
-                """Based on the following data, create the investment signal as Warren Buffett would.
-
-                Analysis Data for {ticker}:
-                {analysis_data}
-
-                Return the trading signal in the following JSON format:
-                {{
-                  "signal": "bullish/bearish/neutral",
-                  "confidence": float (0-100),
-                  "reasoning": "string"
-                }}
-            """,
+                "Analysis Data for {ticker}:\n{analysis_data}",
             ),
         ]
     )
@@ -1,4 +1,14 @@
+import os
 import sys
+import asyncio
+
+from dotenv import load_dotenv
+
+# Load .env before the project imports below, which read their settings from the environment when imported
+load_dotenv(os.getcwd()+'/.env')
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import questionary
@@ -12,12 +22,19 @@ import itertools
 from llm.models import LLM_ORDER, get_model_info
 from utils.analysts import ANALYST_ORDER
 from utils.timeutils import convert_datetime
-from main import run_hedge_fund
+from utils.concurrency import DEFAULT_MAX_WORKERS, set_provider_share
+from utils.ratelimit import get_rate_limit_stats, set_rate_share
+from utils.cache import warm_cache, batched_cache_writes
+from data.price_matrix import PriceMatrix
+from data.signal_store import SignalStore
+from data.backtest_journal import BacktestJournal
+from data.portfolio import ArrayPortfolio
+from utils.metrics import OnlinePerformanceMetrics
+from main import run_hedge_fund, run_analysts
 from tools.api import (
     get_api_client,
 #    get_company_news,
-    get_price_data,
-#    get_prices,
+    get_prices,
 #    get_financial_metrics,
 #    get_insider_trades,
 )
@@ -47,6 +64,20 @@ logger = logging.getLogger(__name__)
 
 init(autoreset=True)
 
+# Processes computing the analyst signals of all days up front with --precompute-signals
+DEFAULT_SIGNAL_WORKERS = int(os.getenv("BACKTEST_SIGNAL_WORKERS", "4"))
+
+
+def _init_signal_worker(share: float):
+    """Process pool initializer: each of the signal workers gets its share of the LLM and API limits."""
+    set_provider_share(share)
+    set_rate_share(share)
+
+
+def _analyze_day(kwargs: dict) -> dict:
+    """Process pool entry point: the analyst signals of one backtest day."""
+    return run_analysts(**kwargs)
+
 
 class Backtester:
     def __init__(
@@ -60,6 +91,11 @@ class Backtester:
         model_provider: str = "OpenAI",
         selected_analysts: list[str] = [],
         initial_margin_requirement: float = 0.0,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        batch_llm: bool = False,
+        precompute_signals: bool = False,
+        signal_workers: int = DEFAULT_SIGNAL_WORKERS,
+        resume: bool = False,
     ):
         """
         :param agent: The trading agent (Callable).
@@ -71,6 +107,11 @@ class Backtester:
         :param model_provider: Which LLM provider (OpenAI, etc).
         :param selected_analysts: List of analyst names or IDs to incorporate.
         :param initial_margin_requirement: The margin ratio (e.g. 0.5 = 50%).
+        :param max_workers: Number of (analyst, ticker) pairs analyzed concurrently.
+        :param batch_llm: Ask persona agents for all tickers' signals in one LLM call.
+        :param precompute_signals: Compute all days' analyst signals in parallel first, then trade day by day.
+        :param signal_workers: Number of processes computing analyst signals.
+        :param resume: Continue after the last day in the journal of an identical earlier backtest.
         """
         self.agent = agent
         self.tickers = tickers
@@ -82,29 +123,28 @@ class Backtester:
         self.selected_analysts = selected_analysts
         # Store the margin ratio (e.g. 0.5 means 50% margin required).
         self.margin_ratio = initial_margin_requirement
+        self.max_workers = max_workers
+        self.batch_llm = batch_llm
+        self.precompute_signals = precompute_signals
+        self.signal_workers = signal_workers
+        self.resume = resume
+        self.journal = BacktestJournal.for_backtest(
+            tickers=tickers,
+            start_date=start_date,
+            end_date=end_date,
+            initial_capital=initial_capital,
+            margin_requirement=initial_margin_requirement,
+            selected_analysts=sorted(selected_analysts or []),
+            model_name=model_name,
+            model_provider=str(getattr(model_provider, "value", model_provider)),
+        )
         self.client=get_api_client()
 
         # Initialize portfolio with support for long/short positions
         self.portfolio_values = []
-        self.portfolio = {
-            "cash": initial_capital,
-            "margin_used": 0.0,  # total margin usage across all short positions
-            "positions": {
-                ticker: {
-                    "long": 0,               # Number of shares held long
-                    "short": 0,              # Number of shares held short
-                    "long_cost_basis": 0.0,  # Average cost basis per share (long)
-                    "short_cost_basis": 0.0, # Average cost basis per share (short)
-                    "short_margin_used": 0.0 # Dollars of margin used for this ticker's short
-                } for ticker in tickers
-            },
-            "realized_gains": {
-                ticker: {
-                    "long": 0.0,   # Realized gains from long positions
-                    "short": 0.0,  # Realized gains from short positions
-                } for ticker in tickers
-            }
-        }
+        # Per ticker: long/short shares, their average cost basis and the margin used
+        # by the short, plus realized gains of each side, all held in arrays
+        self.portfolio = ArrayPortfolio(tickers, initial_capital)
        #self.portfolio_values = []
 
     def prefetch_data(self):
@@ -116,27 +156,103 @@ class Backtester:
         start_date_dt = end_date_dt - relativedelta(years=1)
         start_date_str = start_date_dt.strftime("%Y-%m-%d")
 
-        i=0
-        for ticker in self.tickers:
-            logger.debug("1loop %d",i)
-            logger.info("Prefetching prices for %s and %s",convert_datetime(start_date_dt), convert_datetime(end_date_dt))
-            # Fetch price data for the entire period, plus 1 year
-            self.client.get_prices(ticker, start_date_str, self.end_date)
-            i+=1
+        logger.info("Prefetching prices for %s and %s",convert_datetime(start_date_dt), convert_datetime(end_date_dt))
+        asyncio.run(self._prefetch_async(start_date_str))
+        logger.info("Rate limiter waits during prefetch: %s", get_rate_limit_stats())
+
+        print("Data pre-fetch complete.")
+
+    def load_price_matrix(self) -> PriceMatrix:
+        """
+        Load each ticker's prices for the whole backtest once, as one aligned array.
+
+        The range starts a year early, so the agents' price lookbacks (30 days
+        for the technicals, longer for momentum) can be read from the matrix.
+        """
+        start_date_str = (datetime.strptime(self.start_date, "%Y-%m-%d") - relativedelta(years=1)).strftime("%Y-%m-%d")
+        prices = {
+            ticker: get_prices(ticker, start_date_str, self.end_date)
+            for ticker in self.tickers
+        }
+        return PriceMatrix.from_prices(prices, start_date_str, self.end_date)
+
+    def precompute_analyst_signals(self, dates: pd.DatetimeIndex) -> dict[str, dict]:
+        """
+        Compute the analyst signals of every backtest day in a process pool.
+
+        Each finished day is appended to the signal store straight away, and
+        days already in the store (from an earlier or interrupted run with the
+        same tickers, analysts and model) are not computed again. Days that
+        fail are left out; the backtest runs the full graph for them.
+        """
+        store = SignalStore.for_backtest(self.tickers, self.selected_analysts, self.model_name, self.model_provider)
+        signals = store.load()
+        todo = [current_date for current_date in dates if current_date.strftime("%Y-%m-%d") not in signals]
+        print(f"\nComputing analyst signals for {len(todo)} days in {self.signal_workers} processes "
+              f"({len(dates) - len(todo)} days already in {store.path})...")
+        if not todo:
+            return signals
+
+        # spawn: the parent holds threads and client connections that should not be forked
+        context = multiprocessing.get_context("spawn")
+        # The concurrency and rate limits are per process, so the workers split them
+        share = 1 / self.signal_workers
+        with ProcessPoolExecutor(max_workers=self.signal_workers, mp_context=context,
+                                 initializer=_init_signal_worker, initargs=(share,)) as pool:
+            futures = {
+                pool.submit(_analyze_day, {
+                    "tickers": self.tickers,
+                    "start_date": (current_date - timedelta(days=30)).strftime("%Y-%m-%d"),
+                    "end_date": current_date.strftime("%Y-%m-%d"),
+                    "selected_analysts": self.selected_analysts or None,
+                    "model_name": self.model_name,
+                    "model_provider": self.model_provider,
+                    "max_workers": max(1, int(self.max_workers * share)),
+                    "batch_llm": self.batch_llm,
+                }): current_date.strftime("%Y-%m-%d")
+                for current_date in todo
+            }
+            for future in as_completed(futures):
+                current_date_str = futures[future]
+                try:
+                    signals[current_date_str] = future.result()
+                except Exception as e:
+                    logger.warning("Computing analyst signals for %s failed: %s", current_date_str, e)
+                    continue
+                store.append(current_date_str, signals[current_date_str])
+
+        print("Analyst signals complete.")
+        return signals
+
+    async def _prefetch_async(self, start_date_str: str):
+        """
+        Issue all prefetch requests concurrently over the client's pooled connections.
 
+        The cache is checked for every request in one batch first, only the
+        missing ones are fetched, and their results are written back in one batch.
+        """
+        requests = []
         for ticker in self.tickers:
-            logger.debug("2loop %d",i)
+            # Fetch price data for the entire period, plus 1 year
+            requests.append((self.client.get_prices, self.client.aget_prices, (ticker, start_date_str, self.end_date), {}))
             # Fetch financial metrics
-            self.client.get_financial_metrics(ticker, self.end_date, limit=10)
-
+            requests.append((self.client.get_financial_metrics, self.client.aget_financial_metrics, (ticker, self.end_date), {"limit": 10}))
             # Fetch insider trades for the entire period
-            self.client.get_insider_trades(ticker, end_date=self.end_date, start_date=self.start_date, limit=1000)
-
+            requests.append((self.client.get_insider_trades, self.client.aget_insider_trades, (ticker,), {"end_date": self.end_date, "start_date": self.start_date, "limit": 1000}))
             # Fetch company news for the entire period
-            self.client.get_company_news(ticker, end_date=self.end_date, start_date=self.start_date, limit=1000)
-            i+=1
+            requests.append((self.client.get_company_news, self.client.aget_company_news, (ticker,), {"end_date": self.end_date, "start_date": self.start_date, "limit": 1000}))
 
-        print("Data pre-fetch complete.")
+        cached = warm_cache([(func, args, kwargs) for func, _, args, kwargs in requests])
+        tasks = [
+            afunc(*args, **kwargs)
+            for (_, afunc, args, kwargs), hit in zip(requests, cached)
+            if not hit
+        ]
+
+        logger.debug("Prefetching %d requests for %d tickers, %d already cached",
+                     len(tasks), len(self.tickers), len(requests) - len(tasks))
+        with batched_cache_writes():
+            await asyncio.gather(*tasks)
 
     def parse_agent_response(self, agent_output):
         """Parse JSON output from the agent (fallback to 'hold' if invalid)."""
@@ -321,27 +437,16 @@ class Backtester:
           - market value of long positions
           - unrealized gains/losses for short positions
         """
-        total_value = self.portfolio["cash"]
-
-        for ticker in self.tickers:
-            position = self.portfolio["positions"][ticker]
-            price = current_prices[ticker]
-
-            # Long position value
-            long_value = position["long"] * price
-            total_value += long_value
-
-            # Short position unrealized PnL = short_shares * (short_cost_basis - current_price)
-            if position["short"] > 0:
-                total_value += position["short"] * (position["short_cost_basis"] - price)
-
-        return total_value
+        return self.portfolio.total_value(current_prices)
 
     def run_backtest(self):
         # Pre-fetch all data at the start
         self.prefetch_data()
+        self.price_matrix = self.load_price_matrix()
 
-        dates = pd.date_range(self.start_date, self.end_date, freq="B")
+        # Step through the days that actually have bars, not every business day
+        columns = self.price_matrix.between(self.start_date, self.end_date)
+        dates = pd.DatetimeIndex(self.price_matrix.dates[columns])
         table_rows = []
         performance_metrics = {
             'sharpe_ratio': None,
@@ -366,25 +471,47 @@ class Backtester:
         else:
             self.portfolio_values = []
 
-        for current_date in dates:
+        # Pick up after the last completed day of an interrupted run, or start its journal over
+        completed_days = self.journal.load() if self.resume else []
+        if not self.resume:
+            self.journal.reset()
+        if completed_days:
+            self._restore(completed_days, table_rows, performance_metrics)
+            last_date = completed_days[-1]["date"]
+            remaining = dates > pd.Timestamp(last_date)
+            columns, dates = columns[remaining], dates[remaining]
+            print(f"Resuming after {last_date}: {len(completed_days)} days restored from {self.journal.path}")
+            print_backtest_results(table_rows)
+        elif self.resume:
+            # The journal is keyed on all settings, dates included: --end-date defaults to today
+            print(f"{Fore.YELLOW}Nothing to resume: no journal at {self.journal.path}. Pass the same tickers, "
+                  f"--start-date and --end-date as the interrupted run. Starting from the first day.{Style.RESET_ALL}")
+
+        # Metrics are updated with each day's value instead of being recomputed over the whole history
+        self.online_metrics = OnlinePerformanceMetrics()
+        for row in self.portfolio_values:
+            self.online_metrics.add(row["Portfolio Value"])
+
+        # Analyst signals do not depend on the portfolio, so they can all be computed up front
+        signals_by_date = self.precompute_analyst_signals(dates) if self.precompute_signals else {}
+
+        for column, current_date in zip(columns, dates):
             lookback_start = (current_date - timedelta(days=30)).strftime("%Y-%m-%d")
             current_date_str = current_date.strftime("%Y-%m-%d")
-            previous_date_str = (current_date - timedelta(days=1)).strftime("%Y-%m-%d")
 
             logger.info("Backtester agent looking back from %s to %s",lookback_start, current_date)
             # Skip if there's no prior day to look back (i.e., first date in the range)
             if lookback_start == current_date_str:
                 continue
 
-            # Get current prices for all tickers
-            try:
-                current_prices = {
-                    ticker: get_price_data(ticker, previous_date_str, current_date_str).iloc[-1]["close"]
-                    for ticker in self.tickers
-                }
-            except Exception:
-                # If data is missing or there's an API error, skip this day
-                print(f"Error fetching prices between {previous_date_str} and {current_date_str}")
+            # Get current prices for all tickers: one column of the price matrix
+            current_prices = self.price_matrix.prices_on(column)
+            # The same prices as an array aligned with self.tickers, for the vectorized accounting
+            price_array = self.price_matrix.close[:, column]
+            missing = [ticker for ticker, price in current_prices.items() if np.isnan(price)]
+            if missing:
+                # If a ticker has no bar yet, skip this day
+                print(f"No price data for {', '.join(missing)} on or before {current_date_str}")
                 continue
 
             # ---------------------------------------------------------------
@@ -394,10 +521,15 @@ class Backtester:
                 tickers=self.tickers,
                 start_date=lookback_start,
                 end_date=current_date_str,
-                portfolio=self.portfolio,
+                portfolio=self.portfolio.to_dict(),
                 model_name=self.model_name,
                 model_provider=self.model_provider,
                 selected_analysts=self.selected_analysts,
+                max_workers=self.max_workers,
+                batch_llm=self.batch_llm,
+                price_matrix=self.price_matrix,
+                # None for days without precomputed signals, which then run the analysts too
+                analyst_signals=signals_by_date.get(current_date_str),
             )
 
             decisions = output["decisions"]
@@ -422,7 +554,7 @@ class Backtester:
             # 2) Now that trades have executed trades, recalculate the final
             #    portfolio value for this day.
             # ---------------------------------------------------------------
-            total_value = self.calculate_portfolio_value(current_prices)
+            total_value = self.calculate_portfolio_value(price_array)
 
                 #logger.info("Date ranges from %s to %s",self.start_date, self.end_date)
                 #current_price = df.iloc[-1]["close"]
@@ -431,14 +563,7 @@ class Backtester:
                 #logger.debug(type(current_price))
                 #logger.info("END DF - EOF")
             # Also compute long/short exposures for final post‐trade state
-            long_exposure = sum(
-                self.portfolio["positions"][t]["long"] * current_prices[t]
-                for t in self.tickers
-            )
-            short_exposure = sum(
-                self.portfolio["positions"][t]["short"] * current_prices[t]
-                for t in self.tickers
-            )
+            long_exposure, short_exposure = self.portfolio.exposures(price_array)
 
             # Calculate gross and net exposures
             gross_exposure = long_exposure + short_exposure
@@ -462,9 +587,10 @@ class Backtester:
             # 3) Build the table rows to display
             # ---------------------------------------------------------------
             date_rows = []
+            net_position_values = self.portfolio.position_values(price_array)
 
             # For each ticker, record signals/trades
-            for ticker in self.tickers:
+            for i, ticker in enumerate(self.tickers):
                 ticker_signals = {}
                 for agent_name, signals in analyst_signals.items():
                     if ticker in signals:
@@ -476,9 +602,7 @@ class Backtester:
 
                 # Calculate net position value
                 pos = self.portfolio["positions"][ticker]
-                long_val = pos["long"] * current_prices[ticker]
-                short_val = pos["short"] * current_prices[ticker]
-                net_position_value = long_val - short_val
+                net_position_value = float(net_position_values[i])
 
                 # Get the action and quantity from the decisions
                 action = decisions.get(ticker, {}).get("action", "hold")
@@ -502,11 +626,7 @@ class Backtester:
             # ---------------------------------------------------------------
             # 4) Calculate performance summary metrics
             # ---------------------------------------------------------------
-            total_realized_gains = sum(
-                self.portfolio["realized_gains"][t]["long"] +
-                self.portfolio["realized_gains"][t]["short"]
-                for t in self.tickers
-            )
+            total_realized_gains = self.portfolio.total_realized_gains()
 
             # Calculate cumulative return vs. initial capital
             portfolio_return = ((total_value + total_realized_gains) / self.initial_capital - 1) * 100
@@ -543,47 +663,31 @@ class Backtester:
             print_backtest_results(table_rows)
 
             # Update performance metrics if we have enough data
+            self.online_metrics.add(total_value)
             if len(self.portfolio_values) > 3:
-                self._update_performance_metrics(performance_metrics)
+                self.online_metrics.update(performance_metrics)
+
+            # The day is complete: journal it so a resumed run continues from here
+            self.journal.record({
+                "date": current_date_str,
+                "decisions": decisions,
+                "analyst_signals": analyst_signals,
+                "executed_trades": executed_trades,
+                "portfolio": self.portfolio.to_dict(),
+                "portfolio_value": {**self.portfolio_values[-1], "Date": current_date_str},
+                "table_rows": date_rows,
+                "performance_metrics": performance_metrics,
+            })
 
         return performance_metrics
 
-    def _update_performance_metrics(self, performance_metrics):
-        """Helper method to update performance metrics using daily returns."""
-        values_df = pd.DataFrame(self.portfolio_values).set_index("Date")
-        values_df["Daily Return"] = values_df["Portfolio Value"].pct_change()
-        clean_returns = values_df["Daily Return"].dropna()
-
-        if len(clean_returns) < 2:
-            return  # not enough data points
-
-        # Assumes 252 trading days/year
-        daily_risk_free_rate = 0.0434 / 252
-        excess_returns = clean_returns - daily_risk_free_rate
-        mean_excess_return = excess_returns.mean()
-        std_excess_return = excess_returns.std()
-
-        # Sharpe ratio
-        if std_excess_return > 1e-12:
-            performance_metrics["sharpe_ratio"] = np.sqrt(252) * (mean_excess_return / std_excess_return)
-        else:
-            performance_metrics["sharpe_ratio"] = 0.0
-
-        # Sortino ratio
-        negative_returns = excess_returns[excess_returns < 0]
-        if len(negative_returns) > 0:
-            downside_std = negative_returns.std()
-            if downside_std > 1e-12:
-                performance_metrics["sortino_ratio"] = np.sqrt(252) * (mean_excess_return / downside_std)
-            else:
-                performance_metrics["sortino_ratio"] = float('inf') if mean_excess_return > 0 else 0
-        else:
-            performance_metrics["sortino_ratio"] = float('inf') if mean_excess_return > 0 else 0
-
-        # Maximum drawdown
-        rolling_max = values_df["Portfolio Value"].cummax()
-        drawdown = (values_df["Portfolio Value"] - rolling_max) / rolling_max
-        performance_metrics["max_drawdown"] = drawdown.min() * 100
+    def _restore(self, completed_days: list[dict], table_rows: list, performance_metrics: dict):
+        """Rebuild the state at the end of the last journaled day."""
+        for day in completed_days:
+            table_rows.extend(day["table_rows"])
+            self.portfolio_values.append({**day["portfolio_value"], "Date": pd.Timestamp(day["portfolio_value"]["Date"])})
+        self.portfolio = ArrayPortfolio.from_dict(self.tickers, completed_days[-1]["portfolio"])
+        performance_metrics.update(completed_days[-1]["performance_metrics"])
 
     def analyze_performance(self):
         """Creates a performance DataFrame, prints summary stats, and plots equity curve."""
@@ -708,8 +812,38 @@ if __name__ == "__main__":
         default=20.0,
         help="Margin ratio for short positions, e.g. 0.5 for 50% (default: 0.0)",
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help="Number of (analyst, ticker) pairs to analyze concurrently (default: ANALYST_MAX_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--batch-llm",
+        action="store_true",
+        help="Ask each persona agent for the signals of all tickers in a single LLM call (needs --max-workers 1)",
+    )
+    parser.add_argument(
+        "--precompute-signals",
+        action="store_true",
+        help="Compute all days' analyst signals in parallel processes first, then trade day by day",
+    )
+    parser.add_argument(
+        "--signal-workers",
+        type=int,
+        default=DEFAULT_SIGNAL_WORKERS,
+        help="Processes computing analyst signals with --precompute-signals; they split --max-workers, the LLM concurrency caps and (without Redis) the API rate limits (default: BACKTEST_SIGNAL_WORKERS or 4)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted backtest from its last completed day; all settings, including --start-date and --end-date (which defaults to today), must match",
+    )
 
     args = parser.parse_args()
+    # Pooled agents see one ticker per call, leaving nothing to batch
+    if args.batch_llm and args.max_workers > 1:
+        parser.error("--batch-llm needs all tickers in one agent call, use it with --max-workers 1")
 
     # Parse tickers from comma-separated string
     tickers = [ticker.strip() for ticker in args.tickers.split(",")] if args.tickers else []
@@ -778,6 +912,11 @@ if __name__ == "__main__":
         model_provider=model_provider,
         selected_analysts=selected_analysts,
         initial_margin_requirement=args.margin_requirement,
+        max_workers=args.max_workers,
+        batch_llm=args.batch_llm,
+        precompute_signals=args.precompute_signals,
+        signal_workers=args.signal_workers,
+        resume=args.resume,
     )
 
     performance_metrics = backtester.run_backtest()
@@ -0,0 +1,40 @@
+"""On-disk journal of completed backtest days, from which an interrupted backtest can resume."""
+
+import os
+
+from utils.jsonl import jsonl_path, read_jsonl, append_jsonl
+
+# Directory holding one journal per backtest configuration
+BACKTEST_JOURNAL_DIR = os.getenv("BACKTEST_JOURNAL_DIR", os.path.join(".cache", "backtests"))
+
+
+class BacktestJournal:
+    """
+    One JSON Lines record per completed backtest day.
+
+    A record holds everything the backtest produced that day: the decisions,
+    analyst signals and executed trades, the portfolio after the trades, the
+    portfolio value row, the display rows and the performance metrics. The
+    last record is therefore enough to continue the backtest on the next day.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def for_backtest(cls, root: str = BACKTEST_JOURNAL_DIR, **identity) -> "BacktestJournal":
+        """The journal of the backtest described by `identity` (tickers, dates, capital, model, ...)."""
+        return cls(jsonl_path(root, identity))
+
+    def load(self) -> list[dict]:
+        return read_jsonl(self.path)
+
+    def reset(self):
+        """Start the journal over, for a backtest that is not resumed."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def record(self, day: dict):
+        append_jsonl(self.path, day)
@@ -77,6 +77,13 @@ class LineItemResponse(BaseModel):
     search_results: list[LineItem]
 
 
+class LineItemRequest(BaseModel):
+    """The line items an analyst needs per ticker, used to batch the fetch for all tickers."""
+    line_items: list[str]
+    period: str = "ttm"
+    limit: int = 10
+
+
 class InsiderTrade(BaseModel):
     ticker: str
     issuer: str | None
@@ -0,0 +1,154 @@
+"""Backtest portfolio kept in NumPy arrays (one entry per ticker), with a dict-like view of the old layout."""
+
+from collections.abc import Mapping, MutableMapping
+
+import numpy as np
+
+POSITION_FIELDS = ("long", "short", "long_cost_basis", "short_cost_basis", "short_margin_used")
+GAIN_FIELDS = ("long", "short")
+
+
+class _TickerView(MutableMapping):
+    """One ticker's entries of a group of per-ticker arrays, e.g. portfolio["positions"]["AAPL"]."""
+
+    __slots__ = ("_arrays", "_i")
+
+    def __init__(self, arrays: dict[str, np.ndarray], i: int):
+        self._arrays = arrays
+        self._i = i
+
+    def __getitem__(self, key):
+        return self._arrays[key][self._i].item()
+
+    def __setitem__(self, key, value):
+        self._arrays[key][self._i] = value
+
+    def __delitem__(self, key):
+        raise TypeError("portfolio fields cannot be removed")
+
+    def __iter__(self):
+        return iter(self._arrays)
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _TickerTable(Mapping):
+    """{ticker: _TickerView} over a group of per-ticker arrays, e.g. portfolio["positions"]."""
+
+    __slots__ = ("_arrays", "_index")
+
+    def __init__(self, arrays: dict[str, np.ndarray], index: dict[str, int]):
+        self._arrays = arrays
+        self._index = index
+
+    def __getitem__(self, ticker: str) -> _TickerView:
+        return _TickerView(self._arrays, self._index[ticker])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return repr({ticker: dict(view) for ticker, view in self.items()})
+
+
+class ArrayPortfolio(MutableMapping):
+    """
+    Cash, margin, positions and realized gains of a long/short portfolio.
+
+    Positions and realized gains are arrays indexed like `tickers`, so marking
+    the whole portfolio to market, exposures and P&L are single vector
+    operations on an array of prices. The object still reads and writes like
+    the nested dict the backtester used before:
+
+        portfolio["cash"] -= cost
+        portfolio["positions"]["AAPL"]["long"] += 10
+        portfolio["realized_gains"]["AAPL"]["short"] += gain
+
+    Agents get `to_dict()`, a plain (JSON-serializable) snapshot in that layout.
+    """
+
+    def __init__(self, tickers: list[str], cash: float, margin_used: float = 0.0):
+        self.tickers = list(tickers)
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        n = len(self.tickers)
+        # Shares are whole numbers, everything else is money
+        self.positions = {
+            field: np.zeros(n, dtype=np.int64 if field in ("long", "short") else np.float64)
+            for field in POSITION_FIELDS
+        }
+        self.realized_gains = {field: np.zeros(n) for field in GAIN_FIELDS}
+        self._scalars = {"cash": float(cash), "margin_used": float(margin_used)}
+
+    # Dict-like view
+
+    def __getitem__(self, key: str):
+        if key == "positions":
+            return _TickerTable(self.positions, self._index)
+        if key == "realized_gains":
+            return _TickerTable(self.realized_gains, self._index)
+        return self._scalars[key]
+
+    def __setitem__(self, key: str, value):
+        if key not in self._scalars:
+            raise TypeError(f"portfolio[{key!r}] cannot be replaced, update its entries instead")
+        self._scalars[key] = value
+
+    def __delitem__(self, key: str):
+        raise TypeError("portfolio fields cannot be removed")
+
+    def __iter__(self):
+        yield from self._scalars
+        yield "positions"
+        yield "realized_gains"
+
+    def __len__(self):
+        return len(self._scalars) + 2
+
+    def to_dict(self) -> dict:
+        return {
+            **self._scalars,
+            "positions": {ticker: dict(view) for ticker, view in self["positions"].items()},
+            "realized_gains": {ticker: dict(view) for ticker, view in self["realized_gains"].items()},
+        }
+
+    @classmethod
+    def from_dict(cls, tickers: list[str], data: dict) -> "ArrayPortfolio":
+        portfolio = cls(tickers, data["cash"], data.get("margin_used", 0.0))
+        for group, arrays in (("positions", portfolio.positions), ("realized_gains", portfolio.realized_gains)):
+            for ticker, values in data.get(group, {}).items():
+                for field, value in values.items():
+                    arrays[field][portfolio._index[ticker]] = value
+        return portfolio
+
+    # Vectorized accounting; `prices` is an array aligned with `tickers` or a {ticker: price} dict
+
+    def price_array(self, prices) -> np.ndarray:
+        if isinstance(prices, Mapping):
+            return np.fromiter((prices[ticker] for ticker in self.tickers), dtype=np.float64, count=len(self.tickers))
+        return np.asarray(prices, dtype=np.float64)
+
+    def position_values(self, prices) -> np.ndarray:
+        """Net market value per ticker: long minus short shares, at `prices`."""
+        return (self.positions["long"] - self.positions["short"]) * self.price_array(prices)
+
+    def exposures(self, prices) -> tuple[float, float]:
+        """(long exposure, short exposure) at `prices`."""
+        prices = self.price_array(prices)
+        return float(self.positions["long"] @ prices), float(self.positions["short"] @ prices)
+
+    def total_value(self, prices) -> float:
+        """Cash, plus the long positions at market, plus the unrealized P&L of the short positions."""
+        prices = self.price_array(prices)
+        long_value = self.positions["long"] @ prices
+        short_pnl = self.positions["short"] @ (self.positions["short_cost_basis"] - prices)
+        return float(self._scalars["cash"] + long_value + short_pnl)
+
+    def total_realized_gains(self) -> float:
+        return float(self.realized_gains["long"].sum() + self.realized_gains["short"].sum())
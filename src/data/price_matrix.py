@@ -0,0 +1,139 @@
+"""Daily prices of several tickers aligned on one trading calendar, for replaying bars in backtests."""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from data.models import Price
+
+import logging
+logger = logging.getLogger(__name__)
+
+FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def _to_day(value) -> np.datetime64:
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[D]")
+    if isinstance(value, date):
+        return np.datetime64(value, "D")
+    return np.datetime64(str(value)[:10], "D")
+
+
+class PriceMatrix:
+    """
+    One (tickers x days) float64 array per price field.
+
+    The calendar is the union of the days on which any ticker has a bar, so
+    weekends and holidays never appear. A ticker without a bar on a calendar
+    day (e.g. a trading halt) carries its previous bar forward; days before its
+    first bar are NaN. Each ticker's row is contiguous, so the per-ticker
+    windows returned by `window` are (read-only) views into the matrix, not copies.
+
+    start_date and end_date are the range the prices were requested for, so
+    agents can tell whether the matrix answers their own price query.
+    """
+
+    def __init__(self, tickers: list[str], dates: np.ndarray, fields: dict[str, np.ndarray],
+                 own_bars: np.ndarray | None = None, start_date=None, end_date=None):
+        self.tickers = list(tickers)
+        self.dates = dates
+        self.fields = fields
+        # Which (ticker, day) cells hold the ticker's own bar rather than a carried-forward one
+        self.own_bars = own_bars if own_bars is not None else ~np.isnan(fields["close"])
+        self.start_date = _to_day(start_date) if start_date is not None else (dates[0] if len(dates) else None)
+        self.end_date = _to_day(end_date) if end_date is not None else (dates[-1] if len(dates) else None)
+        self._rows = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def from_prices(cls, prices_by_ticker: dict[str, list[Price]], start_date=None, end_date=None) -> "PriceMatrix":
+        """Build the matrix from each ticker's bars, as returned by get_prices(ticker, start_date, end_date)."""
+        tickers = list(prices_by_ticker)
+        bar_days = {
+            ticker: np.array([_to_day(p.time) for p in prices], dtype="datetime64[D]")
+            for ticker, prices in prices_by_ticker.items()
+        }
+        dates = np.unique(np.concatenate(list(bar_days.values()))) if bar_days else np.array([], dtype="datetime64[D]")
+        fields = {field: np.full((len(tickers), len(dates)), np.nan) for field in FIELDS}
+        own_bars = np.zeros((len(tickers), len(dates)), dtype=bool)
+
+        for row, ticker in enumerate(tickers):
+            prices = prices_by_ticker[ticker]
+            if not prices:
+                logger.warning("No prices for %s, it has no bars in the price matrix", ticker)
+                continue
+            columns = np.searchsorted(dates, bar_days[ticker])
+            own_bars[row, columns] = True
+            for field in FIELDS:
+                fields[field][row, columns] = [getattr(p, field) for p in prices]
+            # Carry the last bar forward over days on which only other tickers traded
+            last = np.maximum.accumulate(np.where(own_bars[row], np.arange(len(dates)), -1))
+            has_bar = last >= 0
+            for field in FIELDS:
+                fields[field][row, has_bar] = fields[field][row, last[has_bar]]
+
+        return cls(tickers, dates, fields, own_bars, start_date, end_date)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._rows
+
+    def covers(self, ticker: str, start_date, end_date) -> bool:
+        """Whether the matrix holds all of the ticker's prices between start_date and end_date."""
+        return (
+            ticker in self._rows
+            and self.start_date is not None
+            and self.start_date <= _to_day(start_date)
+            and _to_day(end_date) <= self.end_date
+        )
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.fields["close"]
+
+    def between(self, start_date, end_date) -> np.ndarray:
+        """Column indices of the calendar days between start_date and end_date (inclusive)."""
+        lo = np.searchsorted(self.dates, _to_day(start_date), side="left")
+        hi = np.searchsorted(self.dates, _to_day(end_date), side="right")
+        return np.arange(lo, hi)
+
+    def prices_on(self, column: int, field: str = "close") -> dict[str, float]:
+        """{ticker: price} for one calendar day; NaN for tickers that have not traded yet."""
+        values = self.fields[field][:, column]
+        return {ticker: float(values[row]) for ticker, row in self._rows.items()}
+
+    def asof(self, ticker: str, day, field: str = "close") -> float:
+        """Price of the last bar on or before `day` (NaN when there is none)."""
+        column = np.searchsorted(self.dates, _to_day(day), side="right") - 1
+        if column < 0:
+            return float("nan")
+        return float(self.fields[field][self._rows[ticker], column])
+
+    def _columns(self, start_date, end_date) -> slice:
+        lo = np.searchsorted(self.dates, _to_day(start_date), side="left")
+        hi = np.searchsorted(self.dates, _to_day(end_date), side="right")
+        return slice(lo, hi)
+
+    def window(self, ticker: str, start_date, end_date, field: str = "close") -> np.ndarray:
+        """Zero-copy, read-only view of a ticker's prices between start_date and end_date (inclusive)."""
+        view = self.fields[field][self._rows[ticker], self._columns(start_date, end_date)]
+        view.flags.writeable = False
+        return view
+
+    def frame(self, ticker: str, start_date, end_date) -> pd.DataFrame:
+        """
+        The ticker's own bars between start_date and end_date, laid out like
+        prices_to_df_alt: a sorted "Date" index and the price columns.
+
+        Days on which only other tickers traded are left out, as get_prices
+        would not return them. When there are none (the usual case) the columns
+        are views of the matrix.
+        """
+        columns = self._columns(start_date, end_date)
+        own = self.own_bars[self._rows[ticker], columns]
+        data = {field: self.window(ticker, start_date, end_date, field) for field in FIELDS}
+        dates = self.dates[columns]
+        if not own.all():
+            data = {field: values[own] for field, values in data.items()}
+            dates = dates[own]
+        return pd.DataFrame(data, index=pd.DatetimeIndex(dates, name="Date"), copy=False)
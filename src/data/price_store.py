@@ -0,0 +1,200 @@
+"""Per-ticker columnar price store (Arrow IPC files) answering date-range queries."""
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data.models import Price
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Directory of the on-disk price store; leave empty to disable it
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", "")
+
+PRICE_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("time", pa.string()),
+    ("open", pa.float64()),
+    ("close", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("volume", pa.float64()),
+])
+
+
+def _to_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def merge_ranges(ranges: list[tuple[date, date]]) -> list[tuple[date, date]]:
+    """Merge overlapping or adjacent (start, end) date ranges, both ends inclusive."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class PriceStore:
+    """
+    Daily prices stored as one Arrow IPC file per ticker, sorted by date.
+
+    Next to each file a small JSON sidecar lists the date ranges that have
+    been fetched, so days without prices (weekends, holidays) are not asked
+    for again. Reads memory-map the file and return a slice of it without
+    copying the columns.
+
+    Several processes (e.g. backtest signal workers) may share the store, so
+    writes hold a per-ticker file lock and replace both files atomically.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _table_path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker}.arrow")
+
+    def _ranges_path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker}.json")
+
+    @contextmanager
+    def _ticker_lock(self, ticker: str):
+        """Exclusive lock on a ticker's files, across threads and processes."""
+        with self._lock, open(os.path.join(self.root, f"{ticker}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def covered_ranges(self, ticker: str) -> list[tuple[date, date]]:
+        try:
+            with open(self._ranges_path(ticker), encoding="utf-8") as f:
+                return [(_to_date(start), _to_date(end)) for start, end in json.load(f)]
+        except FileNotFoundError:
+            return []
+
+    def missing_ranges(self, ticker: str, start_date, end_date) -> list[tuple[date, date]]:
+        """Return the parts of [start_date, end_date] that have not been fetched yet."""
+        start, end = _to_date(start_date), _to_date(end_date)
+        missing = []
+        cursor = start
+        for covered_start, covered_end in self.covered_ranges(ticker):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, covered_start - timedelta(days=1)))
+            cursor = max(cursor, covered_end + timedelta(days=1))
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def _load(self, ticker: str) -> pa.Table:
+        path = self._table_path(ticker)
+        if not os.path.exists(path):
+            return PRICE_SCHEMA.empty_table()
+        # The table's buffers point into the mapping, which stays open as long as they are referenced
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    def write(self, ticker: str, prices: list[Price], start_date, end_date):
+        """Add `prices` to the store and mark [start_date, end_date] as fetched (nothing if start > end)."""
+        new = pa.Table.from_pylist(
+            [
+                {
+                    "date": _to_date(p.time),
+                    "time": p.time,
+                    "open": p.open,
+                    "close": p.close,
+                    "high": p.high,
+                    "low": p.low,
+                    "volume": p.volume,
+                }
+                for p in prices
+            ],
+            schema=PRICE_SCHEMA,
+        )
+
+        # Another process may have written since this one read the file, so re-read under the lock
+        with self._ticker_lock(ticker):
+            table = pa.concat_tables([self._load(ticker), new])
+            if new.num_rows:
+                # Keep one row per day, newly fetched rows win
+                df = table.to_pandas().drop_duplicates("date", keep="last").sort_values("date")
+                table = pa.Table.from_pandas(df, schema=PRICE_SCHEMA, preserve_index=False)
+
+                tmp_path = self._table_path(ticker) + ".tmp"
+                with pa.OSFile(tmp_path, "wb") as sink:
+                    with pa.ipc.new_file(sink, PRICE_SCHEMA) as writer:
+                        writer.write_table(table)
+                # The rows must be on disk before the sidecar marks their range as fetched
+                _fsync(tmp_path)
+                os.replace(tmp_path, self._table_path(ticker))
+
+            if _to_date(start_date) > _to_date(end_date):
+                return
+            ranges = merge_ranges(self.covered_ranges(ticker) + [(_to_date(start_date), _to_date(end_date))])
+            tmp_path = self._ranges_path(ticker) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([[start.isoformat(), end.isoformat()] for start, end in ranges], f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._ranges_path(ticker))
+
+    def read(self, ticker: str, start_date, end_date) -> pa.Table:
+        """Return the stored rows between start_date and end_date (inclusive) as a zero-copy slice."""
+        with self._lock:
+            table = self._load(ticker)
+        dates = table.column("date").to_numpy()
+        lo = np.searchsorted(dates, np.datetime64(_to_date(start_date)), side="left")
+        hi = np.searchsorted(dates, np.datetime64(_to_date(end_date)), side="right")
+        return table.slice(lo, hi - lo)
+
+    def read_prices(self, ticker: str, start_date, end_date) -> list[Price]:
+        table = self.read(ticker, start_date, end_date).drop(["date"])
+        return [Price.model_construct(**row) for row in table.to_pylist()]
+
+    def read_df(self, ticker: str, start_date, end_date) -> pd.DataFrame:
+        """Same frame layout as prices_to_df_alt: a sorted "Date" index and the numeric price columns."""
+        df = self.read(ticker, start_date, end_date).drop(["date"]).to_pandas()
+        df.index = pd.DatetimeIndex(pd.to_datetime(df["time"]), name="Date")
+        return df
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_price_store() -> PriceStore | None:
+    """Return the shared price store, or None when PRICE_STORE_DIR is not set."""
+    global _store
+    if not PRICE_STORE_DIR:
+        return None
+    with _store_lock:
+        if _store is None:
+            logger.debug("Using price store in %s", PRICE_STORE_DIR)
+            _store = PriceStore(PRICE_STORE_DIR)
+        return _store
@@ -0,0 +1,40 @@
+"""Analyst signals of past backtest days, kept on disk so they are computed only once."""
+
+import os
+
+from utils.jsonl import jsonl_path, read_jsonl, append_jsonl
+
+# Directory holding one JSON Lines file of analyst signals per backtest configuration
+SIGNAL_STORE_DIR = os.getenv("SIGNAL_STORE_DIR", os.path.join(".cache", "signals"))
+
+
+class SignalStore:
+    """
+    Append-only JSON Lines file of {"date": ..., "analyst_signals": {...}} records.
+
+    The file name is derived from everything the signals depend on (tickers,
+    analysts, model), so a backtest rerun with the same setup picks up the
+    days it already has. A record is written as soon as its day is done, which
+    makes the file a checkpoint: an interrupted run loses at most the days
+    that were in flight.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def for_backtest(cls, tickers: list[str], selected_analysts: list[str], model_name: str, model_provider: str,
+                     root: str = SIGNAL_STORE_DIR) -> "SignalStore":
+        return cls(jsonl_path(root, {
+            "tickers": sorted(tickers),
+            "analysts": sorted(selected_analysts or []),
+            "model": model_name,
+            "provider": str(getattr(model_provider, "value", model_provider)),
+        }))
+
+    def load(self) -> dict[str, dict]:
+        """{date: analyst_signals} of all stored days."""
+        return {record["date"]: record["analyst_signals"] for record in read_jsonl(self.path)}
+
+    def append(self, date: str, analyst_signals: dict):
+        append_jsonl(self.path, {"date": date, "analyst_signals": analyst_signals})
@@ -0,0 +1,112 @@
+"""Helpers to run analyst nodes per ticker instead of looping over all tickers in one call."""
+
+import json
+from functools import wraps
+
+from langchain_core.messages import HumanMessage
+from langgraph.types import Send
+
+from graph.state import AgentState
+from utils.concurrency import get_worker_pool
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def shard_state(state: AgentState, ticker: str) -> dict:
+    """
+    Build a copy of the state that only covers a single ticker.
+
+    The shard gets its own analyst_signals dict so agents writing into it
+    cannot clobber each other; portfolio and metadata are shared read-only.
+    """
+    return {
+        "messages": [],
+        "data": {**state["data"], "tickers": [ticker], "analyst_signals": {}},
+        "metadata": state["metadata"],
+    }
+
+
+def merge_shard_results(tickers: list[str], results: dict[str, dict]) -> tuple[dict, list]:
+    """
+    Merge per-ticker agent results back together in the order of `tickers`.
+
+    Returns the combined analyst_signals ({agent_name: {ticker: signal}}) and a
+    single message per agent whose content is the merged JSON payload.
+    """
+    signals = {}
+    contents = {}
+    for ticker in tickers:
+        result = results.get(ticker)
+        if not result:
+            continue
+        for agent_name, ticker_signals in result["data"].get("analyst_signals", {}).items():
+            signals.setdefault(agent_name, {}).update(ticker_signals)
+
+        if result.get("messages"):
+            message = result["messages"][-1]
+            try:
+                payload = json.loads(message.content)
+            except (TypeError, json.JSONDecodeError):
+                payload = {ticker: message.content}
+            contents.setdefault(message.name, {}).update(payload)
+
+    messages = [HumanMessage(content=json.dumps(content), name=name) for name, content in contents.items()]
+    return signals, messages
+
+
+def parallel_analyst_node(agent_func, max_workers: int):
+    """
+    Wrap an analyst node so that every ticker runs as its own task on the shared worker pool.
+
+    The wrapped node behaves like the original one: it writes its signals into
+    state["data"]["analyst_signals"] and returns the (shared) data dict.
+    """
+    @wraps(agent_func)
+    def node(state: AgentState):
+        tickers = state["data"]["tickers"]
+        pool = get_worker_pool(max_workers)
+
+        futures = {ticker: pool.submit(agent_func, shard_state(state, ticker)) for ticker in tickers}
+        results = {ticker: future.result() for ticker, future in futures.items()}
+
+        signals, messages = merge_shard_results(tickers, results)
+        for agent_name, ticker_signals in signals.items():
+            state["data"]["analyst_signals"][agent_name] = ticker_signals
+
+        return {
+            "messages": messages,
+            "data": state["data"],
+        }
+
+    return node
+
+
+def ticker_shard_node(agent_func):
+    """
+    Wrap an analyst so it can be the target of a per-ticker Send.
+
+    The node receives a single-ticker shard and only returns its own slice of
+    analyst_signals; the state reducer merges the slices of all shards.
+    """
+    @wraps(agent_func)
+    def node(state: AgentState):
+        result = agent_func(state)
+        return {
+            "messages": result.get("messages", [])[-1:],
+            "data": {"analyst_signals": result["data"].get("analyst_signals", {})},
+        }
+
+    return node
+
+
+def fan_out_by_ticker(node_names: list[str]):
+    """Return a routing function that sends one shard per (analyst node, ticker) pair."""
+    def route(state: AgentState) -> list[Send]:
+        return [
+            Send(node_name, shard_state(state, ticker))
+            for node_name in node_names
+            for ticker in state["data"]["tickers"]
+        ]
+
+    return route
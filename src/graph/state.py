@@ -8,7 +8,18 @@ import json
 
 
 def merge_dicts(a: dict[str, any], b: dict[str, any]) -> dict[str, any]:
-    return {**a, **b}
+    merged = {**a, **b}
+    # Per-ticker shards each report a slice of analyst_signals, merge them per agent
+    if "analyst_signals" in a and "analyst_signals" in b:
+        merged["analyst_signals"] = merge_analyst_signals(a["analyst_signals"], b["analyst_signals"])
+    return merged
+
+
+def merge_analyst_signals(a: dict[str, dict], b: dict[str, dict]) -> dict[str, dict]:
+    merged = dict(a)
+    for agent_name, ticker_signals in b.items():
+        merged[agent_name] = {**a.get(agent_name, {}), **ticker_signals}
+    return merged
 
 
 # Define agent state
@@ -1,4 +1,5 @@
 import os
+import threading
 from langchain_anthropic import ChatAnthropic
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
@@ -92,14 +93,19 @@ def get_model_info(model_name: str) -> LLMModel | None:
     """Get model information by model_name"""
     return next((model for model in AVAILABLE_MODELS if model.model_name == model_name), None)
 
-def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | ChatGroq | None:
+def get_model(model_name: str, model_provider: ModelProvider, request_timeout: float | None = None) -> ChatOpenAI | ChatGroq | None:
+    """
+    Build the chat model. With `request_timeout` every request is given up
+    after that many seconds and the client does not retry on its own.
+    """
+    client_options = {"timeout": request_timeout, "max_retries": 0} if request_timeout else {}
     if model_provider == ModelProvider.GROQ:
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             # Print error to console
             print("API Key Error: Please make sure GROQ_API_KEY is set in your .env file.")
             raise ValueError("Groq API key not found.  Please make sure GROQ_API_KEY is set in your .env file.")
-        return ChatGroq(model=model_name, api_key=api_key)
+        return ChatGroq(model=model_name, api_key=api_key, **client_options)
     elif model_provider == ModelProvider.OPENAI:
         # Get and validate API key
         api_key = os.getenv("OPENAI_API_KEY")
@@ -107,18 +113,39 @@ def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | Ch
             # Print error to console
             print("API Key Error: Please make sure OPENAI_API_KEY is set in your .env file.")
             raise ValueError("OpenAI API key not found.  Please make sure OPENAI_API_KEY is set in your .env file.")
-        return ChatOpenAI(model=model_name, api_key=api_key)
+        return ChatOpenAI(model=model_name, api_key=api_key, **client_options)
     elif model_provider == ModelProvider.ANTHROPIC:
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             print("API Key Error: Please make sure ANTHROPIC_API_KEY is set in your .env file.")
             raise ValueError("Anthropic API key not found.  Please make sure ANTHROPIC_API_KEY is set in your .env file.")
-        return ChatAnthropic(model=model_name, api_key=api_key)
+        return ChatAnthropic(model=model_name, api_key=api_key, **client_options)
     elif model_provider == ModelProvider.OLLAMA:
         # Ollama runs locally, so we don't need an API key
         try:
-            return ChatOllama(model=model_name)
+            return ChatOllama(model=model_name, client_kwargs={"timeout": request_timeout} if request_timeout else {})
         except Exception as e:
             print(f"Ollama Error: Make sure Ollama is running locally and the model is pulled. Error: {str(e)}")
             raise ValueError(f"Failed to initialize Ollama model. Make sure Ollama is running and the model is pulled: {str(e)}")
     return None
+
+
+_models: dict[tuple[str, str, float | None], ChatOpenAI | ChatGroq | ChatAnthropic | ChatOllama] = {}
+_models_lock = threading.Lock()
+
+
+def get_cached_model(model_name: str, model_provider: ModelProvider, request_timeout: float | None = None) -> ChatOpenAI | ChatGroq | None:
+    """
+    Like get_model, but returns one shared instance per (provider, model).
+
+    The chat models are thread-safe and own their HTTP clients, so sharing
+    them keeps one connection pool per model instead of one per call.
+    """
+    key = (str(getattr(model_provider, "value", model_provider)), model_name, request_timeout)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = get_model(model_name, model_provider, request_timeout)
+            if model is not None:
+                _models[key] = model
+        return model
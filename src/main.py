@@ -4,8 +4,14 @@ import logging
 import os
 
 from dotenv import load_dotenv
+
+# Load environment variables from .env file before the project imports below,
+# which read their settings from the environment when they are imported
+load_dotenv(os.getcwd()+'/.env')
+
 from langchain_core.messages import HumanMessage
 from langgraph.graph import END, StateGraph
+from langgraph.types import RetryPolicy
 from colorama import Fore, Style, init
 import questionary
 
@@ -18,20 +24,29 @@ from agents.risk_manager import risk_management_agent
 from agents.sentiment import sentiment_agent
 from agents.warren_buffett import warren_buffett_agent
 from graph.state import AgentState
+from graph.parallel import parallel_analyst_node, ticker_shard_node, fan_out_by_ticker
 from agents.valuation import valuation_agent
 from utils.display import print_trading_output
-from utils.analysts import ANALYST_ORDER, get_analyst_nodes
+from utils.analysts import ANALYST_ORDER, get_analyst_nodes, get_line_item_requests
 from utils.progress import progress
+from utils.concurrency import DEFAULT_MAX_WORKERS
+from utils.cache import get_cache_stats, get_compression_stats
+from utils.llm import start_llm_budget, stop_llm_budget, get_llm_usage_stats
 from llm.models import LLM_ORDER, get_model_info
+from data.price_matrix import PriceMatrix
 
 import argparse
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from tabulate import tabulate
 from utils.visualize import save_graph_as_png
+from tools.api import prefetch_line_items, start_request_tracking, stop_request_tracking
 import json
 
 
+# Attempts per (analyst, ticker) shard when running the per-ticker graph
+SHARD_MAX_ATTEMPTS = int(os.getenv("SHARD_MAX_ATTEMPTS", "2"))
+
 # Set the logging level based on an environment variable
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 #LOG_LEVEL = logging.DEBUG
@@ -64,14 +79,7 @@ console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
 
-# Debug before loading the .env file
-logger.debug("Before load_dotenv: USE_IBKR = %r", os.environ.get("USE_IBKR"))
 logger.debug("Current working directory: %s", os.getcwd())
-# Load environment variables from .env file
-# dotenv_path='/path/to/your/.env')
-load_dotenv(os.getcwd()+'/.env')
-
-# Debug after loading the .env file
 logger.debug("After load_dotenv: USE_IBKR = %r", os.environ.get("USE_IBKR"))
 
 
@@ -93,6 +101,26 @@ def parse_hedge_fund_response(response):
         return None
 
 
+def initial_state(tickers, start_date, end_date, portfolio, analyst_signals, metadata, price_matrix=None) -> dict:
+    return {
+        "messages": [
+            HumanMessage(
+                content="Make trading decisions based on the provided data.",
+            )
+        ],
+        "data": {
+            "tickers": tickers,
+            "portfolio": portfolio,
+            "start_date": start_date,
+            "end_date": end_date,
+            "analyst_signals": analyst_signals,
+            # Backtests pass all tickers' prices preloaded; live runs fetch them
+            "price_matrix": price_matrix,
+        },
+        "metadata": metadata,
+    }
+
+
 ##### Run the Hedge Fund #####
 def run_hedge_fund(
     tickers: list[str],
@@ -103,38 +131,50 @@ def run_hedge_fund(
     selected_analysts: list[str] = [],
     model_name: str = "gpt-4o",
     model_provider: str = "OpenAI",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    shard_by_ticker: bool = False,
+    batch_llm: bool = False,
+    price_matrix: PriceMatrix | None = None,
+    analyst_signals: dict | None = None,
 ):
+    """
+    Run the graph for one day and return the decisions and all signals.
+
+    When `analyst_signals` is given (signals computed earlier, see run_analysts)
+    the analysts are skipped and only risk and portfolio management run.
+    """
     # Start progress tracking
     progress.start()
+    start_request_tracking()
+    start_llm_budget()
 
     try:
+        if analyst_signals is not None:
+            agent = create_decision_workflow().compile()
         # Create a new workflow if analysts are customized
-        if selected_analysts:
-            workflow = create_workflow(selected_analysts)
+        elif selected_analysts:
+            workflow = create_workflow(selected_analysts, max_workers=max_workers, shard_by_ticker=shard_by_ticker)
             agent = workflow.compile()
         else:
             agent = app
 
         final_state = agent.invoke(
-            {
-                "messages": [
-                    HumanMessage(
-                        content="Make trading decisions based on the provided data.",
-                    )
-                ],
-                "data": {
-                    "tickers": tickers,
-                    "portfolio": portfolio,
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "analyst_signals": {},
-                },
-                "metadata": {
+            initial_state(
+                tickers, start_date, end_date, portfolio,
+                # Copied, as risk management adds its own signals to the dict
+                analyst_signals={**analyst_signals} if analyst_signals is not None else {},
+                metadata={
                     "show_reasoning": show_reasoning,
                     "model_name": model_name,
                     "model_provider": model_provider,
+                    "batch_llm": batch_llm,
                 },
-            },
+                price_matrix=price_matrix,
+            ),
+            # Bounds how many shards LangGraph runs at once in per-ticker mode. The serial
+            # default of one worker would defeat sharding, so it then runs one shard per ticker
+            # at a time; the provider caps still bound the LLM calls.
+            config={"max_concurrency": max_workers if max_workers > 1 else len(tickers)} if shard_by_ticker else None,
         )
 
         return {
@@ -144,6 +184,49 @@ def run_hedge_fund(
     finally:
         # Stop progress tracking
         progress.stop()
+        stop_llm_budget()
+        logger.info("Data requests this run: %s", stop_request_tracking())
+        logger.info("Cache lookups so far: %s", get_cache_stats())
+        if compression_stats := get_compression_stats():
+            logger.info("Cache compression so far: %s", compression_stats)
+        if llm_usage := get_llm_usage_stats():
+            logger.info("LLM tokens so far: %s", llm_usage)
+
+
+def run_analysts(
+    tickers: list[str],
+    start_date: str,
+    end_date: str,
+    selected_analysts: list[str],
+    model_name: str = "gpt-4o",
+    model_provider: str = "OpenAI",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    batch_llm: bool = False,
+) -> dict:
+    """
+    Run only the analysts for one day and return their signals.
+
+    Analyst signals do not depend on the portfolio, so backtests can compute
+    them for many days up front (in other processes, without the progress
+    display) and feed them to run_hedge_fund afterwards.
+    """
+    start_llm_budget()
+    try:
+        agent = create_workflow(selected_analysts, max_workers=max_workers, with_decisions=False).compile()
+        final_state = agent.invoke(
+            initial_state(
+                tickers, start_date, end_date, portfolio={}, analyst_signals={},
+                metadata={
+                    "show_reasoning": False,
+                    "model_name": model_name,
+                    "model_provider": model_provider,
+                    "batch_llm": batch_llm,
+                },
+            ),
+        )
+        return final_state["data"]["analyst_signals"]
+    finally:
+        stop_llm_budget()
 
 
 def start(state: AgentState):
@@ -151,10 +234,31 @@ def start(state: AgentState):
     return state
 
 
-def create_workflow(selected_analysts=None):
-    """Create the workflow with selected analysts."""
+def start_with_line_items(line_item_requests: list):
+    """Start node that first batch-fetches the line items of all selected analysts for all tickers."""
+    def start_node(state: AgentState):
+        data = state["data"]
+        prefetch_line_items(data["tickers"], data["end_date"], line_item_requests)
+        return start(state)
+
+    return start_node
+
+
+def create_workflow(selected_analysts=None, max_workers: int = DEFAULT_MAX_WORKERS, shard_by_ticker: bool = False, with_decisions: bool = True):
+    """
+    Create the workflow with selected analysts.
+
+    Without with_decisions the graph ends after the analysts, leaving out risk
+    and portfolio management.
+
+    With max_workers > 1 every analyst node runs its tickers as separate
+    (analyst, ticker) tasks on a shared pool of max_workers threads.
+
+    With shard_by_ticker the graph itself fans out: start_node sends one
+    single-ticker shard to every analyst node, each shard is retried on its
+    own, and the reducer merges the per-ticker signals before risk management.
+    """
     workflow = StateGraph(AgentState)
-    workflow.add_node("start_node", start)
 
     # Get analyst nodes from the configuration
     analyst_nodes = get_analyst_nodes()
@@ -163,11 +267,30 @@ def create_workflow(selected_analysts=None):
     if selected_analysts is None:
         selected_analysts = list(analyst_nodes.keys())
 
+    workflow.add_node("start_node", start_with_line_items(get_line_item_requests(selected_analysts)))
+
     # Add selected analyst nodes
     for analyst_key in selected_analysts:
         node_name, node_func = analyst_nodes[analyst_key]
-        workflow.add_node(node_name, node_func)
-        workflow.add_edge("start_node", node_name)
+        if shard_by_ticker:
+            # LangGraph's default retry_on retries transient failures, not programming errors
+            workflow.add_node(node_name, ticker_shard_node(node_func), retry=RetryPolicy(max_attempts=SHARD_MAX_ATTEMPTS))
+        else:
+            if max_workers > 1:
+                node_func = parallel_analyst_node(node_func, max_workers)
+            workflow.add_node(node_name, node_func)
+            workflow.add_edge("start_node", node_name)
+
+    if shard_by_ticker:
+        node_names = [analyst_nodes[analyst_key][0] for analyst_key in selected_analysts]
+        workflow.add_conditional_edges("start_node", fan_out_by_ticker(node_names), node_names)
+
+    workflow.set_entry_point("start_node")
+
+    if not with_decisions:
+        for analyst_key in selected_analysts:
+            workflow.add_edge(analyst_nodes[analyst_key][0], END)
+        return workflow
 
     # Always add risk and portfolio management
     workflow.add_node("risk_management_agent", risk_management_agent)
@@ -180,8 +303,17 @@ def create_workflow(selected_analysts=None):
 
     workflow.add_edge("risk_management_agent", "portfolio_management_agent")
     workflow.add_edge("portfolio_management_agent", END)
+    return workflow
 
-    workflow.set_entry_point("start_node")
+
+def create_decision_workflow():
+    """Create the workflow that only runs risk and portfolio management on signals computed earlier."""
+    workflow = StateGraph(AgentState)
+    workflow.add_node("risk_management_agent", risk_management_agent)
+    workflow.add_node("portfolio_management_agent", portfolio_management_agent)
+    workflow.add_edge("risk_management_agent", "portfolio_management_agent")
+    workflow.add_edge("portfolio_management_agent", END)
+    workflow.set_entry_point("risk_management_agent")
     return workflow
 
 
@@ -225,6 +357,22 @@ if __name__ == "__main__":
         type=str,
         help="Model provider (e.g., 'OpenAI')"
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help="Number of (analyst, ticker) pairs to analyze concurrently. Defaults to ANALYST_MAX_WORKERS or 1"
+    )
+    parser.add_argument(
+        "--shard-by-ticker",
+        action="store_true",
+        help="Build a per-ticker map/reduce graph instead of per-agent ticker loops; --max-workers bounds the shards run at once, and with 1 (the default) as many shards as tickers run at once"
+    )
+    parser.add_argument(
+        "--batch-llm",
+        action="store_true",
+        help="Ask each persona agent for the signals of all tickers in a single LLM call (needs --max-workers 1, no --shard-by-ticker)"
+    )
     parser.add_argument(
         "--initial-positions",
         type=str,
@@ -232,6 +380,9 @@ if __name__ == "__main__":
     )
 
     args = parser.parse_args()
+    # Sharded and pooled agents see one ticker per call, leaving nothing to batch
+    if args.batch_llm and (args.shard_by_ticker or args.max_workers > 1):
+        parser.error("--batch-llm needs all tickers in one agent call, use it with --max-workers 1 and without --shard-by-ticker")
 
     # Parse tickers from comma-separated string
     tickers = [ticker.strip() for ticker in args.tickers.split(",")]
@@ -304,7 +455,7 @@ if __name__ == "__main__":
                 print(f"\nSelected model: {Fore.GREEN + Style.BRIGHT}{model_choice}{Style.RESET_ALL}\n")
 
     # Create the workflow with selected analysts
-    workflow = create_workflow(selected_analysts)
+    workflow = create_workflow(selected_analysts, max_workers=args.max_workers, shard_by_ticker=args.shard_by_ticker)
     app = workflow.compile()
 
     if args.show_agent_graph:
@@ -398,5 +549,8 @@ if __name__ == "__main__":
         selected_analysts=selected_analysts,
         model_name=model_choice,
         model_provider=model_provider,
+        max_workers=args.max_workers,
+        shard_by_ticker=args.shard_by_ticker,
+        batch_llm=args.batch_llm,
     )
     print_trading_output(result)
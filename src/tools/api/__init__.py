@@ -1,33 +1,120 @@
 import os
+import inspect
+import threading
+import time
 #import pandas as pd
 #from pprint import pprint
 
 from .financials_client import FinancialsAPIClient
 from .ibkr_client import IBKRClientWrapper
+from .singleflight import SingleFlight
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Seconds between IBKR session health checks (check_health + tickle keep-alive)
+IBKR_HEALTH_CHECK_INTERVAL = float(os.getenv("IBKR_HEALTH_CHECK_INTERVAL", "60"))
+
+# One client per backend, built on first use and shared by all threads
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class _ClientEntry:
+    def __init__(self, client):
+        self.client = client
+        self.checked_at = time.monotonic()
+
+
+def _create_client(use_ibkr: bool):
+    if use_ibkr:
+        return IBKRClientWrapper()
+    return FinancialsAPIClient()
+
+
+def _ibkr_is_healthy(client) -> bool:
+    try:
+        # tickle keeps the gateway session alive, check_health reports whether it still is
+        client.tickle()
+        return bool(client.check_health())
+    except Exception as e:
+        logger.warning("IBKR health check failed: %s", e)
+        return False
+
 
 def get_api_client():
     """
     Factory function to choose the API client.
     If the environment variable USE_IBKR is set to "true" (case-insensitive),
     returns an IBKR client; otherwise, returns the legacy Financials API client.
+
+    Clients are created lazily once per process and reused. The IBKR client is
+    health-checked every IBKR_HEALTH_CHECK_INTERVAL seconds and rebuilt when the
+    gateway session is gone.
     """
     use_ibkr = os.getenv("USE_IBKR", "false").lower() == "true"
-    if use_ibkr:
-        return IBKRClientWrapper()
-    else:
-        return FinancialsAPIClient()
+    entry = _clients.get(use_ibkr)
+    if entry is not None and (not use_ibkr or time.monotonic() - entry.checked_at < IBKR_HEALTH_CHECK_INTERVAL):
+        return entry.client
+
+    with _clients_lock:
+        entry = _clients.get(use_ibkr)
+        if entry is None:
+            logger.debug("Creating %s API client", "IBKR" if use_ibkr else "Financial Datasets")
+            entry = _ClientEntry(_create_client(use_ibkr))
+            _clients[use_ibkr] = entry
+        elif use_ibkr and time.monotonic() - entry.checked_at >= IBKR_HEALTH_CHECK_INTERVAL:
+            if not _ibkr_is_healthy(entry.client):
+                logger.info("Reconnecting IBKR client")
+                entry = _ClientEntry(_create_client(use_ibkr))
+                _clients[use_ibkr] = entry
+            entry.checked_at = time.monotonic()
+        return entry.client
+
+
+def reset_api_client():
+    """Drop the cached clients so the next call to get_api_client builds new ones."""
+    with _clients_lock:
+        _clients.clear()
+
+# Identical data requests issued by several analysts share one call
+_single_flight = SingleFlight()
+
+
+def _call_shared(method_name: str, *args, **kwargs):
+    """Call a client method through the single-flight layer, keyed on its bound arguments."""
+    client = get_api_client()
+    method = getattr(client, method_name)
+    try:
+        bound = inspect.signature(method).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+    except TypeError:
+        # Let the client raise its own error for bad arguments
+        return method(*args, **kwargs)
+    key = SingleFlight.make_key(f"{type(client).__name__}.{method_name}", arguments)
+    return _single_flight.do(key, method, *args, **kwargs)
+
+
+def start_request_tracking():
+    """Share results of identical requests for the rest of this run and reset the counters."""
+    _single_flight.start_run()
+
+
+def stop_request_tracking() -> dict:
+    """End the run and return its hit/miss/coalesced counters."""
+    return _single_flight.end_run()
+
 
 #    def get_financial_metrics(self, ticker, end_date, period="ttm", limit=10):
 #    def get_prices(self, ticker, start_date: str, end_date: str):
 
 # Convenience function for compatibility.
 def get_financial_metrics(*args, **kwargs):
-    client = get_api_client()
-    return client.get_financial_metrics(*args, **kwargs)
+    return _call_shared("get_financial_metrics", *args, **kwargs)
 
 def get_prices(*args, **kwargs):
-    client = get_api_client()
-    return client.get_prices(*args, **kwargs)
+    return _call_shared("get_prices", *args, **kwargs)
 
 def prices_to_df(*args, **kwargs):
     client = get_api_client()
@@ -54,22 +141,91 @@ def get_portfolio(*args, **kwargs):
     return client.get_portfolio(*args, **kwargs)
 
 def get_company_news(*args, **kwargs):
-    client = get_api_client()
-    return client.get_company_news(*args, **kwargs)
+    return _call_shared("get_company_news", *args, **kwargs)
 
 def get_price_data(*args, **kwargs):
     client = get_api_client()
     return client.get_price_data(*args, **kwargs)
 
 def get_insider_trades(*args, **kwargs):
-    client = get_api_client()
-    return client.get_insider_trades(*args, **kwargs)
+    return _call_shared("get_insider_trades", *args, **kwargs)
 
 def get_market_cap(*args, **kwargs):
+    return _call_shared("get_market_cap", *args, **kwargs)
+
+def search_line_items(ticker, line_items: list[str], end_date: str, period: str = "30d", limit: int = 100, **kwargs):
+    # Serve from the batch fetched by prefetch_line_items when it covers this request
+    with _line_items_lock:
+        entry = _line_items_store.get((ticker, end_date, period))
+    if entry is not None:
+        fetched_items, fetched_limit, results = entry
+        if fetched_limit >= limit and set(line_items) <= fetched_items:
+            return results[:limit]
+
+    return _call_shared("search_line_items", ticker, line_items, end_date, period=period, limit=limit, **kwargs)
+
+
+# (ticker, end_date, period) -> (line item names, limit, results) fetched in bulk for the current run
+_line_items_store = {}
+_line_items_lock = threading.Lock()
+
+
+def prefetch_line_items(tickers: list[str], end_date: str, requests: list):
+    """
+    Fetch the union of the line items requested by all analysts for all tickers in bulk.
+
+    `requests` is a list of LineItemRequest. Requests are grouped per period,
+    their line items merged and the largest limit used, so each group costs a
+    handful of POSTs instead of one per (analyst, ticker). Afterwards
+    search_line_items answers matching calls from memory; tickers that got
+    fewer than `limit` periods are fetched per ticker as before.
+    """
+    groups = {}
+    for request in requests:
+        items, limit = groups.get(request.period, (set(), 0))
+        groups[request.period] = (items | set(request.line_items), max(limit, request.limit))
+
+    store = {}
+    client = get_api_client()
+    for period, (items, limit) in groups.items():
+        try:
+            results = client.search_line_items_bulk(tickers, sorted(items), end_date, period=period, limit=limit)
+        except NotImplementedError:
+            return
+        except Exception as e:
+            # Agents fall back to their own per-ticker calls
+            logger.warning("Bulk line item fetch failed for period %s: %s", period, e)
+            continue
+        for ticker, ticker_results in results.items():
+            # A batch shares one row budget, so a short result may just mean other
+            # tickers used it up; leave those tickers to their own per-ticker calls
+            if len(ticker_results) < limit:
+                logger.debug("Bulk line items for %s (%s) returned %d of %d periods, not storing them", ticker, period, len(ticker_results), limit)
+                continue
+            store[(ticker, end_date, period)] = (frozenset(items), limit, ticker_results)
+
+    with _line_items_lock:
+        _line_items_store.clear()
+        _line_items_store.update(store)
+
+
+# Async variants, used to issue many requests concurrently (e.g. during prefetch).
+async def aget_prices(*args, **kwargs):
     client = get_api_client()
-    return client.get_market_cap(*args, **kwargs)
+    return await client.aget_prices(*args, **kwargs)
 
-def search_line_items(*args, **kwargs):
+async def aget_financial_metrics(*args, **kwargs):
     client = get_api_client()
-    return client.search_line_items(*args, **kwargs)
+    return await client.aget_financial_metrics(*args, **kwargs)
 
+async def asearch_line_items(*args, **kwargs):
+    client = get_api_client()
+    return await client.asearch_line_items(*args, **kwargs)
+
+async def aget_insider_trades(*args, **kwargs):
+    client = get_api_client()
+    return await client.aget_insider_trades(*args, **kwargs)
+
+async def aget_company_news(*args, **kwargs):
+    client = get_api_client()
+    return await client.aget_company_news(*args, **kwargs)
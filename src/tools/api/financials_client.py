@@ -2,8 +2,14 @@ import os
 import sys
 import re
 import time
+import asyncio
+import threading
 import requests
 import pandas as pd
+from datetime import date, timedelta
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from pprint import pprint
 
 from utils.timeutils import convert_to_date, extract_date_limits
@@ -26,18 +32,105 @@ from data.models import (
 # For demonstration, we treat the JSON as a dictionary.
 # You can import your Pydantic models if you have them.
 
-from utils.cache import cache_api_response
+from utils.cache import cache_api_response, cache_range_response
+from data.price_store import get_price_store
+from utils.ratelimit import get_rate_limiter
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of tickers sent in one bulk line-item search
+LINE_ITEMS_BATCH_SIZE = int(os.getenv("LINE_ITEMS_BATCH_SIZE", "5"))
+
+# Size of the keep-alive connection pool and of the thread pool backing the async methods
+POOL_SIZE = int(os.getenv("FINANCIAL_DATASETS_POOL_SIZE", "32"))
+
+_session = None
+_io_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide Session so every client instance shares keep-alive connections."""
+    global _session
+    with _pool_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Return the thread pool that runs blocking requests for the async client methods."""
+    global _io_pool
+    with _pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="financials-io")
+        return _io_pool
+
+
 class FinancialsAPIClient:
     def __init__(self, config=None):
         self.config = config or {}
         # Limit might be used to restrict to 5 tickers, etc.
         self.limit = self.config.get("limit", 5)
+        self.session = get_session()
 
-    @cache_api_response(timeout=60000)
+    def _request(self, method: str, endpoint: str, url: str, max_retries: int = 5, **kwargs) -> requests.Response:
+        """
+        Send a request after taking a token from the endpoint's rate limiter.
+
+        HTTP 429 responses are retried after the delay the API asks for
+        ("Expected available in N second" or a Retry-After header).
+        """
+        limiter = get_rate_limiter(endpoint)
+        for attempt in range(max_retries):
+            limiter.acquire()
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code != 429:
+                return response
+
+            delay = 1
+            try:
+                if retry_after := response.headers.get("Retry-After"):
+                    delay = int(retry_after)
+                else:
+                    detail = response.json().get("detail", "")
+                    # Try to extract the delay from the detail message, e.g., "Expected available in 1 second"
+                    match = re.search(r'(\d+)\s*second', detail)
+                    delay = int(match.group(1)) if match else 1
+            except Exception:
+                delay = 1
+            logger.warning("429 received on %s. Throttled. Retrying in %d second(s) (attempt %d/%d)",
+                           endpoint, delay, attempt + 1, max_retries)
+            time.sleep(delay)
+        return response
+
+    async def _run_async(self, func, *args, **kwargs):
+        """Run a blocking client method on the I/O pool so many requests can overlap."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_io_pool(), partial(func, *args, **kwargs))
+
+    async def aget_prices(self, *args, **kwargs):
+        return await self._run_async(self.get_prices, *args, **kwargs)
+
+    async def aget_financial_metrics(self, *args, **kwargs) -> list[FinancialMetrics]:
+        return await self._run_async(self.get_financial_metrics, *args, **kwargs)
+
+    async def asearch_line_items(self, *args, **kwargs) -> list[LineItem]:
+        return await self._run_async(self.search_line_items, *args, **kwargs)
+
+    async def aget_insider_trades(self, *args, **kwargs) -> list[InsiderTrade]:
+        return await self._run_async(self.get_insider_trades, *args, **kwargs)
+
+    async def aget_company_news(self, *args, **kwargs) -> list[CompanyNews]:
+        return await self._run_async(self.get_company_news, *args, **kwargs)
+
+    # Fundamentals change slowly: past expiry, keep serving them for a day while they refresh
+    @cache_api_response(timeout=60000, stale_timeout=86400)
     def get_financial_metrics(self, ticker: str, end_date: str, period: str = "ttm", limit: int = 10,) -> list[FinancialMetrics]:
 
         headers = {}
@@ -53,7 +146,7 @@ class FinancialsAPIClient:
             "period": period
         }
 
-        response = requests.get(url, headers=headers, params=params)
+        response = self._request("GET", "financial_metrics", url, headers=headers, params=params)
         if response.status_code != 200:
             raise Exception(f"Error fetching data: {ticker} - {response.status_code} - {response.text}")
 
@@ -74,8 +167,41 @@ class FinancialsAPIClient:
 
         return financial_metrics
 
-    @cache_api_response(timeout=60000)
-    def get_prices(self, ticker, start_date: str, end_date: str, max_retries=5, limit=5000):
+    @cache_range_response(timeout=60000, date_field="time")
+    def get_prices(self, ticker, start_date: str, end_date: str, max_retries=5, limit=5000) -> list[Price]:
+        """
+        Fetch price data, from the local price store when PRICE_STORE_DIR is set.
+
+        With the store enabled only the date ranges it has not seen yet are
+        requested from the API; everything else is read from disk.
+        """
+        store = get_price_store()
+        if store is None:
+            response = self._fetch_prices(ticker, start_date, end_date, max_retries, limit)
+            return response.prices if response else []
+
+        # Today's bar may still be missing or change, so never mark it as fetched
+        last_final_day = date.today() - timedelta(days=1)
+        for gap_start, gap_end in store.missing_ranges(ticker, start_date, end_date):
+            while True:
+                response = self._fetch_prices(ticker, gap_start.isoformat(), gap_end.isoformat(), max_retries, limit)
+                prices = response.prices if response else []
+                covered_start = gap_start
+                truncated = len(prices) >= limit
+                if truncated:
+                    # As in cache_range_response, the API limit cuts the oldest rows:
+                    # only trust the range from the day after the oldest row returned
+                    oldest = min(date.fromisoformat(p.time[:10]) for p in prices)
+                    covered_start = oldest + timedelta(days=1)
+                store.write(ticker, prices, covered_start, min(gap_end, last_final_day))
+                if not truncated or oldest >= gap_end:
+                    break
+                # Fetch the older part of the gap that was cut off
+                gap_end = oldest
+
+        return store.read_prices(ticker, start_date, end_date)
+
+    def _fetch_prices(self, ticker, start_date: str, end_date: str, max_retries=5, limit=5000):
         """Fetch price data from API with retry logic for rate limiting and server errors."""
         headers = {}
         if (api_key := os.environ.get("FINANCIAL_DATASETS_API_KEY")):
@@ -94,22 +220,8 @@ class FinancialsAPIClient:
         retries = 0
         while retries < max_retries:
             try:
-                response = requests.get(url, params=params, headers=headers)
-                # If rate-limited (HTTP 429)
-                if response.status_code == 429:
-                    try:
-                        data = response.json()
-                        detail = data.get("detail", "")
-                        # Try to extract the delay from the detail message, e.g., "Expected available in 1 second"
-                        match = re.search(r'(\d+)\s*second', detail)
-                        delay = int(match.group(1)) if match else 1
-                    except Exception:
-                        delay = 1
-                    logger.warning("429 received. Throttled. Retrying in %d second(s) (attempt %d/%d)",
-                                   delay, retries + 1, max_retries)
-                    time.sleep(delay*2)
-                    retries += 1
-                    continue
+                # Rate limiting and HTTP 429 are handled by _request
+                response = self._request("GET", "prices", url, params=params, headers=headers)
 
                 # If server errors (5xx)
                 if response.status_code >= 500:
@@ -160,7 +272,7 @@ class FinancialsAPIClient:
           "limit": limit
       }
 
-      response = requests.post(url, headers=headers, json=body)
+      response = self._request("POST", "line_items", url, headers=headers, json=body)
       if response.status_code != 200:
           raise Exception(f"Error fetching data: {ticker} - {response.status_code} - {response.text}")
       data = response.json()
@@ -171,7 +283,45 @@ class FinancialsAPIClient:
 
       return search_results[:limit]
 
-    @cache_api_response(timeout=60000)
+    def search_line_items_bulk(self, tickers: list[str], line_items: list[str], end_date: str, period: str = "ttm", limit: int = 10) -> dict[str, list[LineItem]]:
+        """
+        Fetch line items for many tickers with as few POSTs as possible.
+
+        Tickers are sent in batches of LINE_ITEMS_BATCH_SIZE; the results are
+        split per ticker and truncated to `limit` periods each. The batch
+        shares one row budget, so a ticker can come back with fewer than
+        `limit` periods when others took more of it.
+        """
+        headers = {}
+        if api_key := os.environ.get("FINANCIAL_DATASETS_API_KEY"):
+            headers["X-API-KEY"] = api_key
+
+        url = "https://api.financialdatasets.ai/financials/search/line-items"
+
+        results = {ticker: [] for ticker in tickers}
+        for i in range(0, len(tickers), LINE_ITEMS_BATCH_SIZE):
+            batch = tickers[i:i + LINE_ITEMS_BATCH_SIZE]
+            body = {
+                "tickers": batch,
+                "line_items": line_items,
+                "end_date": end_date,
+                "period": period,
+                # Leave room for `limit` periods of every ticker in the batch
+                "limit": limit * len(batch),
+            }
+
+            response = self._request("POST", "line_items", url, headers=headers, json=body)
+            if response.status_code != 200:
+                raise Exception(f"Error fetching data: {batch} - {response.status_code} - {response.text}")
+            response_model = LineItemResponse(**response.json())
+
+            for item in response_model.search_results:
+                if item.ticker in results and len(results[item.ticker]) < limit:
+                    results[item.ticker].append(item)
+
+        return results
+
+    @cache_range_response(timeout=60000, date_field="filing_date", stale_timeout=86400)
     def get_insider_trades(self, ticker, end_date: str, start_date: str | None = None, limit: int = 1000, ) -> list[InsiderTrade]:
         """Fetch insider trades from cache or API."""
         # Check cache first
@@ -205,7 +355,7 @@ class FinancialsAPIClient:
             params["filing_date_gte"] = start_date
 
         while True:
-            response = requests.get(url, headers=headers, params=params)
+            response = self._request("GET", "insider_trades", url, headers=headers, params=params)
             if response.status_code != 200:
                 raise Exception(f"Error fetching data: {ticker} - {response.status_code} - {response.text}")
 
@@ -228,8 +378,6 @@ class FinancialsAPIClient:
             # If we've reached or passed the start_date, we can stop
             if current_end_date <= start_date:
                 break
-            # throthle this loop
-            time.sleep(1)
 
         if not all_trades:
             return []
@@ -237,7 +385,7 @@ class FinancialsAPIClient:
         return all_trades
 
 
-    @cache_api_response(timeout=60000)
+    @cache_range_response(timeout=60000, date_field="date")
     def get_company_news( self, ticker, end_date: str | None, start_date: str | None = None, limit: int = 500 ) -> list[CompanyNews]:
         """Fetch company news from cache or API."""
         #if cached_data := _cache.get_company_news(ticker):
@@ -271,7 +419,7 @@ class FinancialsAPIClient:
         all_news = []
 
         while True:
-            response = requests.get(url, headers=headers, params=params)
+            response = self._request("GET", "news", url, headers=headers, params=params)
             if response.status_code != 200:
                 raise Exception(f"Error fetching data: {ticker} - {response.status_code} - {response.text}")
 
@@ -304,9 +452,6 @@ class FinancialsAPIClient:
             if convert_to_date(first_date) >= convert_to_date(end_date):
                 break
 
-            # throthle this loop, it hits the rpm limiter
-            time.sleep(1)
-
         if not all_news:
             return []
         logger.info("ALL news articles count: %d", len(all_news))
@@ -483,9 +628,16 @@ class FinancialsAPIClient:
         return df
 
     # Update the get_price_data function to use the new functions
-    @cache_api_response(timeout=60000)
     def get_price_data(self, ticker, start_date: str, end_date: str) -> pd.DataFrame:
         prices = self.get_prices(ticker, start_date, end_date)
+
+        # get_prices fills the store, unless its result came from the API cache.
+        # When the store does cover the range, build the frame straight from its columns.
+        store = get_price_store()
+        last_final_day = (date.today() - timedelta(days=1)).isoformat()
+        if store is not None and not store.missing_ranges(ticker, start_date, min(end_date, last_final_day)):
+            return store.read_df(ticker, start_date, end_date)
+
         #logger.debug(prices)
         #logger.debug(type(prices))
         return self.prices_to_df_alt(prices)
@@ -464,3 +464,6 @@ class IBKRClientWrapper:
     def search_line_items(self, ticker, line_items: list[str], end_date: str, period: str = "30d" , limit: int = 100) -> list[LineItem]:
         raise NotImplementedError("IBKR client does not implement search_line_items")
 
+    def search_line_items_bulk(self, tickers: list[str], line_items: list[str], end_date: str, period: str = "ttm", limit: int = 10) -> dict[str, list[LineItem]]:
+        raise NotImplementedError("IBKR client does not implement search_line_items_bulk")
+
@@ -0,0 +1,73 @@
+"""Coalesce identical concurrent data requests into a single call."""
+
+import json
+import threading
+from concurrent.futures import Future
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Share one call (and one deserialized result) between identical requests.
+
+    Callers asking for a key that is already in flight wait for that call
+    instead of issuing their own ("coalesced"). While a run is active,
+    completed results are also kept so later identical calls in the same run
+    are answered from memory ("hit"). Outside a run only in-flight calls are
+    shared, so long-lived processes never serve stale results.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+        self._active = False
+        self._stats = {"hit": 0, "miss": 0, "coalesced": 0}
+
+    @staticmethod
+    def make_key(name: str, arguments: dict) -> str:
+        return f"{name}:{json.dumps(arguments, sort_keys=True, default=str)}"
+
+    def do(self, key: str, func, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+                self._stats["miss"] += 1
+                leader = True
+            else:
+                self._stats["hit" if future.done() else "coalesced"] += 1
+                leader = False
+
+        if leader:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    # Never keep failures, and only keep results for the duration of a run
+                    if not self._active or future.exception() is not None:
+                        self._calls.pop(key, None)
+
+        return future.result()
+
+    def start_run(self):
+        """Start keeping completed results and reset the counters."""
+        with self._lock:
+            self._calls.clear()
+            self._active = True
+            self._stats = {"hit": 0, "miss": 0, "coalesced": 0}
+
+    def end_run(self) -> dict:
+        """Drop the results kept for this run and return its counters."""
+        with self._lock:
+            self._active = False
+            self._calls = {key: future for key, future in self._calls.items() if not future.done()}
+            return dict(self._stats)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
@@ -1,46 +1,52 @@
 """Constants and utilities related to analysts configuration."""
 
-from agents.ben_graham import ben_graham_agent
-from agents.bill_ackman import bill_ackman_agent
-from agents.cathie_wood import cathie_wood_agent
-from agents.charlie_munger import charlie_munger_agent
+from agents.ben_graham import ben_graham_agent, LINE_ITEM_REQUEST as BEN_GRAHAM_LINE_ITEMS
+from agents.bill_ackman import bill_ackman_agent, LINE_ITEM_REQUEST as BILL_ACKMAN_LINE_ITEMS
+from agents.cathie_wood import cathie_wood_agent, LINE_ITEM_REQUEST as CATHIE_WOOD_LINE_ITEMS
+from agents.charlie_munger import charlie_munger_agent, LINE_ITEM_REQUEST as CHARLIE_MUNGER_LINE_ITEMS
 from agents.fundamentals import fundamentals_agent
 from agents.sentiment import sentiment_agent
-from agents.stanley_druckenmiller import stanley_druckenmiller_agent
+from agents.stanley_druckenmiller import stanley_druckenmiller_agent, LINE_ITEM_REQUEST as STANLEY_DRUCKENMILLER_LINE_ITEMS
 from agents.technicals import technical_analyst_agent
-from agents.valuation import valuation_agent
-from agents.warren_buffett import warren_buffett_agent
+from agents.valuation import valuation_agent, LINE_ITEM_REQUEST as VALUATION_LINE_ITEMS
+from agents.warren_buffett import warren_buffett_agent, LINE_ITEM_REQUEST as WARREN_BUFFETT_LINE_ITEMS
 
 # Define analyst configuration - single source of truth
 ANALYST_CONFIG = {
     "ben_graham": {
         "display_name": "Ben Graham",
         "agent_func": ben_graham_agent,
+        "line_items": BEN_GRAHAM_LINE_ITEMS,
         "order": 0,
     },
     "bill_ackman": {
         "display_name": "Bill Ackman",
         "agent_func": bill_ackman_agent,
+        "line_items": BILL_ACKMAN_LINE_ITEMS,
         "order": 1,
     },
     "cathie_wood": {
         "display_name": "Cathie Wood",
         "agent_func": cathie_wood_agent,
+        "line_items": CATHIE_WOOD_LINE_ITEMS,
         "order": 2,
     },
     "charlie_munger": {
         "display_name": "Charlie Munger",
         "agent_func": charlie_munger_agent,
+        "line_items": CHARLIE_MUNGER_LINE_ITEMS,
         "order": 3,
     },
     "stanley_druckenmiller": {
         "display_name": "Stanley Druckenmiller",
         "agent_func": stanley_druckenmiller_agent,
+        "line_items": STANLEY_DRUCKENMILLER_LINE_ITEMS,
         "order": 4,
     },
     "warren_buffett": {
         "display_name": "Warren Buffett",
         "agent_func": warren_buffett_agent,
+        "line_items": WARREN_BUFFETT_LINE_ITEMS,
         "order": 5,
     },
     "technical_analyst": {
@@ -61,6 +67,7 @@ ANALYST_CONFIG = {
     "valuation_analyst": {
         "display_name": "Valuation Analyst",
         "agent_func": valuation_agent,
+        "line_items": VALUATION_LINE_ITEMS,
         "order": 9,
     },
 }
@@ -73,3 +80,10 @@ ANALYST_ORDER = [
 def get_analyst_nodes():
     """Get the mapping of analyst keys to their (node_name, agent_func) tuples."""
     return {key: (f"{key}_agent", config["agent_func"]) for key, config in ANALYST_CONFIG.items()}
+
+
+def get_line_item_requests(selected_analysts=None):
+    """Get the LineItemRequest of every selected analyst that reads financial line items."""
+    if selected_analysts is None:
+        selected_analysts = list(ANALYST_CONFIG.keys())
+    return [ANALYST_CONFIG[key]["line_items"] for key in selected_analysts if "line_items" in ANALYST_CONFIG.get(key, {})]
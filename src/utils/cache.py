@@ -1,15 +1,282 @@
+import os
+import time
+import random
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import msgpack
 import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 from pydantic import BaseModel
 from functools import wraps
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, get_args
 import hashlib
 import json
 import inspect
+from datetime import date, timedelta
+
+from utils.cache_backends import CACHE_BACKEND, create_cache_backend
+from utils.cache_compression import CacheDecompressionError, create_compression
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Setup Redis connection (connecting happens on first use)
+redis_client = redis.StrictRedis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", "6379")),
+    db=0,
+    decode_responses=False,
+    socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1")),
+    # A cache miss is cheaper than waiting for a server that is not there
+    retry=Retry(NoBackoff(), 1),
+)
+
+# Where cached entries live, see utils.cache_backends
+cache_backend = create_cache_backend(CACHE_BACKEND, redis_client)
+# How payloads are compressed, see utils.cache_compression
+compression = create_compression(cache_backend)
+
+# In-process tier in front of the cache backend: total size of the cached payloads and
+# the default number of seconds an entry is served without asking the backend.
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "300"))
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU of encoded cache entries with per-entry expiry.
+
+    Values are the same bytes that are stored in the backend, so the size limit is
+    exact and callers always get freshly decoded (unshared) objects.
+    """
+
+    def __init__(self, max_bytes: int = LOCAL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _count(self, name: str, counter: str):
+        stats = self._stats.setdefault(name, {"local_hits": 0, "backend_hits": 0, "misses": 0})
+        stats[counter] += 1
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes, ttl: float):
+        if ttl <= 0 or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def record(self, name: str, counter: str):
+        with self._lock:
+            self._count(name, counter)
+
+    def stats(self) -> dict[str, dict]:
+        """Per-function counters plus the share of lookups answered in process."""
+        with self._lock:
+            stats = {}
+            for name, counters in self._stats.items():
+                total = sum(counters.values())
+                stats[name] = {**counters, "local_hit_rate": round(counters["local_hits"] / total, 3) if total else 0.0}
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self._stats.clear()
+
+
+local_cache = LocalCache()
+
+
+def _cache_get(key: str, name: str, local_ttl: float) -> bytes | None:
+    """Look `key` up in the in-process tier, then in the cache backend (copying its hits into the local tier)."""
+    data = local_cache.get(key)
+    if data is not None:
+        local_cache.record(name, "local_hits")
+        return data
+    data = cache_backend.get(key)
+    if data:
+        local_cache.record(name, "backend_hits")
+        local_cache.set(key, data, local_ttl)
+        return data
+    local_cache.record(name, "misses")
+    return None
+
+
+# Backend writes held back by batched_cache_writes(), {key: (data, timeout)}
+_pending_writes = None
+_pending_lock = threading.Lock()
+
+
+def _cache_set(key: str, data: bytes, timeout: int, local_ttl: float):
+    with _pending_lock:
+        if _pending_writes is not None:
+            _pending_writes[key] = (data, timeout)
+        else:
+            cache_backend.set(key, data, timeout)
+    local_cache.set(key, data, min(local_ttl, timeout))
+
+
+def _cache_exists(keys: list[str]) -> list[bool]:
+    with _pending_lock:
+        pending = set(_pending_writes or ())
+    alive = cache_backend.exists_many([key for key in keys if key not in pending])
+    alive = iter(alive)
+    return [key in pending or next(alive) for key in keys]
+
+
+@contextmanager
+def batched_cache_writes():
+    """Hold back cache writes made inside the block and send them to the backend in one batch at the end."""
+    global _pending_writes
+    with _pending_lock:
+        outer = _pending_writes is not None
+        if not outer:
+            _pending_writes = {}
+    try:
+        yield
+    finally:
+        if not outer:
+            with _pending_lock:
+                items, _pending_writes = _pending_writes, None
+            if items:
+                cache_backend.set_many(items)
+
+
+def warm_cache(calls: list[tuple]) -> list[bool]:
+    """
+    Check many decorated calls against the cache in one backend round trip.
+
+    `calls` holds (function, args, kwargs) tuples, where function is a method
+    decorated with cache_api_response or cache_range_response (bound or not).
+    Entries found are copied into the in-process tier, so making those calls
+    afterwards does not touch the backend. Returns, per call, whether its
+    result is cached; undecorated functions always count as not cached.
+    """
+    call_keys = []
+    for method, args, kwargs in calls:
+        func = getattr(method, "__func__", method)
+        if hasattr(method, "__self__"):
+            args = (method.__self__, *args)
+        cache_keys = getattr(func, "cache_keys", None)
+        call_keys.append((cache_keys(*args, **kwargs), func.local_ttl) if cache_keys else ([], 0))
+
+    keys = list({key: None for keys, _ in call_keys for key in keys})
+    found = {}
+    missing = [key for key in keys if local_cache.get(key) is None]
+    for key, data in zip(missing, cache_backend.get_many(missing)):
+        if data:
+            found[key] = data
+
+    cached = []
+    for keys, local_ttl in call_keys:
+        for key in keys:
+            if key in found:
+                local_cache.set(key, found[key], local_ttl)
+        # The first key holds the call's own result, the others help later lookups
+        cached.append(bool(keys) and local_cache.get(keys[0]) is not None)
+    return cached
+
+
+def get_cached(key: str, name: str, local_ttl: float = LOCAL_CACHE_TTL) -> bytes | None:
+    """Raw lookup for callers that manage their own keys and encoding (counted under `name`)."""
+    return _cache_get(key, name, local_ttl)
+
+
+def set_cached(key: str, data: bytes, timeout: int, local_ttl: float = LOCAL_CACHE_TTL):
+    _cache_set(key, data, _jitter(timeout), local_ttl)
+
+
+def get_cache_stats() -> dict[str, dict]:
+    return local_cache.stats()
+
+
+def get_compression_stats() -> dict[str, dict]:
+    return compression.stats()
+
+
+# Random spread applied to every cache timeout (0.1 = +/-10%), so entries
+# written together (e.g. all tickers of one prefetch) do not expire together.
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", "0.1"))
+# Threads refreshing stale entries in the background
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+
+# Stale-while-revalidate entries start with this marker followed by the time
+# (a little-endian double) until which they are fresh. 0xc1 is never used by
+# msgpack, so plain entries cannot be mistaken for one.
+_SWR_MAGIC = b"\xc1swr"
+_SWR_HEADER = struct.Struct("<d")
+
+_refresh_pool = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_refreshing = set()
+_refresh_lock = threading.Lock()
 
 
-# Setup Redis connection
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=False)
+def _jitter(timeout: float) -> int:
+    return max(1, int(timeout * random.uniform(1 - CACHE_TTL_JITTER, 1 + CACHE_TTL_JITTER)))
+
+
+def _make_entry(data: bytes, timeout: int, stale_timeout: int | None) -> tuple[bytes, int]:
+    """Return the bytes to store and their backend TTL."""
+    fresh_for = _jitter(timeout)
+    if not stale_timeout:
+        return data, fresh_for
+    return _SWR_MAGIC + _SWR_HEADER.pack(time.time() + fresh_for) + data, fresh_for + stale_timeout
+
+
+def _open_entry(data: bytes) -> tuple[bytes, bool]:
+    """Split a stored entry into its payload and whether it is stale."""
+    if data.startswith(_SWR_MAGIC):
+        (fresh_until,) = _SWR_HEADER.unpack_from(data, len(_SWR_MAGIC))
+        return data[len(_SWR_MAGIC) + _SWR_HEADER.size:], time.time() >= fresh_until
+    return data, False
+
+
+def _schedule_refresh(key: str, refresh):
+    """Run `refresh` on the refresh pool unless a refresh of `key` is already running."""
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            refresh()
+        except Exception as e:
+            logger.warning("Background refresh of a stale cache entry failed: %s", e)
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    _refresh_pool.submit(run)
 
 # Helper function to serialize a Pydantic model to msgpack
 def serialize_pydantic(model: Any) -> bytes:
@@ -48,49 +315,269 @@ def deserialize_pydantic_item(item: Any, model_class: BaseModel) -> BaseModel:
         return item
 
 
+def _contains_model(annotation) -> bool:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return True
+    return any(_contains_model(arg) for arg in get_args(annotation))
+
+
+class ModelCodec:
+    """
+    msgpack codec for the values returned by one cached function.
+
+    The return annotation is inspected once, when the function is decorated.
+    Lists of flat models are stored column-wise (field names once, then one
+    row of values per item). Cached data was validated when it was fetched,
+    so flat models are rebuilt without validation. That is done by filling
+    the instance __dict__ directly, which is what model_construct does minus
+    its per-field default handling (the fastest model_construct is still
+    slower than validating). Models with nested models still go through
+    model_validate.
+    """
+
+    def __init__(self, return_type):
+        self.many = getattr(return_type, "__origin__", None) is list
+        if self.many:
+            return_type = get_args(return_type)[0]
+        # Payloads are compressed per type, e.g. "CompanyNews"
+        self.name = getattr(return_type, "__name__", "value")
+        self.model_class = None
+        if isinstance(return_type, type) and issubclass(return_type, BaseModel):
+            self.model_class = return_type
+            self.fields = list(return_type.model_fields)
+            self.flat = not any(_contains_model(field.annotation) for field in return_type.model_fields.values())
+            # Instances can only be assembled by hand when pydantic keeps nothing but the fields
+            self.plain = (
+                self.flat
+                and not return_type.__private_attributes__
+                and return_type.model_config.get("extra") != "allow"
+            )
+
+    @classmethod
+    def for_function(cls, func) -> "ModelCodec":
+        return cls(inspect.signature(func).return_annotation)
+
+    def encode(self, value: Any) -> bytes:
+        model_class = self.model_class
+        if (
+            self.many and model_class is not None and self.flat and isinstance(value, list)
+            and all(type(item) is model_class for item in value)
+        ):
+            fields = self.fields
+            rows = [[getattr(item, field) for field in fields] for item in value]
+            return compression.compress(self.name, msgpack.packb({"columns": fields, "rows": rows}, use_bin_type=True))
+        if isinstance(value, list):
+            value = [item.model_dump() if isinstance(item, BaseModel) else item for item in value]
+        elif isinstance(value, BaseModel):
+            value = value.model_dump()
+        return compression.compress(self.name, msgpack.packb(value, use_bin_type=True))
+
+    def _build(self, item: dict) -> BaseModel:
+        if self.flat:
+            return self.model_class.model_construct(**item)
+        return self.model_class.model_validate(item)
+
+    def decode(self, data: bytes) -> Any:
+        """Rebuild a cached value; raises CacheDecompressionError if a compressed payload cannot be restored."""
+        payload = msgpack.unpackb(compression.decompress(self.name, data), raw=False)
+        if isinstance(payload, dict) and payload.keys() == {"columns", "rows"}:
+            columns = payload["columns"]
+            if not self.plain or columns != self.fields:
+                construct = self.model_class.model_construct
+                return [construct(**dict(zip(columns, row))) for row in payload["rows"]]
+
+            model_class = self.model_class
+            new = object.__new__
+            set_attr = object.__setattr__
+            fields_set = set(columns)
+            items = []
+            for row in payload["rows"]:
+                item = new(model_class)
+                set_attr(item, "__dict__", dict(zip(columns, row)))
+                set_attr(item, "__pydantic_fields_set__", fields_set.copy())
+                set_attr(item, "__pydantic_extra__", None)
+                set_attr(item, "__pydantic_private__", None)
+                items.append(item)
+            return items
+        if isinstance(payload, list):
+            # Row-wise layout written by serialize_pydantic
+            return [self._build(item) if isinstance(item, dict) else item for item in payload]
+        if isinstance(payload, dict):
+            return self._build(payload)
+        return payload
+
+
 # Generate a cache key based on the function name and arguments
 def generate_cache_key(func, args, kwargs):
     cache_key = f"{func.__name__}:{json.dumps((args[1:], kwargs), sort_keys=True)}"
     return hashlib.sha256(cache_key.encode()).hexdigest()
 
-# The decorator to cache API responses in Redis
-def cache_api_response(timeout: int = 3600):
+# The decorator to cache API responses (in process, then in the cache backend).
+# With stale_timeout set, an entry older than `timeout` is still served for
+# up to stale_timeout more seconds while it is refreshed in the background.
+def cache_api_response(timeout: int = 3600, local_timeout: float = LOCAL_CACHE_TTL, stale_timeout: int | None = None):
     def decorator(func):
+        codec = ModelCodec.for_function(func)
+        local_ttl = min(local_timeout, timeout)
+
+        def fetch_and_store(cache_key, args, kwargs):
+            # Make the API call and cache the serialized result with the generated key
+            result = func(*args, **kwargs)
+            data, ttl = _make_entry(codec.encode(result), timeout, stale_timeout)
+            _cache_set(cache_key, data, ttl, local_ttl)
+            return result
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             cache_key = generate_cache_key(func, args, kwargs)
 
-            # Check if data is cached in Redis
-            cached_data = redis_client.get(cache_key)
-            if cached_data:
-                return_type = inspect.signature(func).return_annotation
+            # Check if data is cached (in process, then the backend); only model return types can be rebuilt
+            if codec.model_class is not None:
+                cached_data = _cache_get(cache_key, func.__name__, local_ttl)
+                if cached_data:
+                    payload, stale = _open_entry(cached_data)
+                    try:
+                        result = codec.decode(payload)
+                    except CacheDecompressionError as e:
+                        logger.warning("Ignoring unreadable cache entry for %s: %s", func.__name__, e)
+                    else:
+                        if stale:
+                            _schedule_refresh(cache_key, lambda: fetch_and_store(cache_key, args, kwargs))
+                        return result
 
-                if hasattr(return_type, '__origin__') and return_type.__origin__ is list:
-                    # Handle List[Model]
-                    model_class = return_type.__args__[0]
-                    return deserialize_pydantic(cached_data, model_class)
-                elif isinstance(return_type, type) and issubclass(return_type, BaseModel):
-                    # Handle a single BaseModel
-                    return deserialize_pydantic(cached_data, return_type)
+            return fetch_and_store(cache_key, args, kwargs)
 
-            # If no cache, make the API call and cache the result
+        # Used by warm_cache; results that cannot be rebuilt are never served, so have no key
+        wrapper.cache_keys = lambda *args, **kwargs: (
+            [generate_cache_key(func, args, kwargs)] if codec.model_class is not None else []
+        )
+        wrapper.local_ttl = local_ttl
+        return wrapper
+    return decorator
+
+
+# Maximum number of cached ranges remembered per (function, other arguments)
+RANGE_INDEX_SIZE = 32
+
+
+def _day(value) -> str | None:
+    return str(value)[:10] if value else None
+
+
+def cache_range_response(
+    timeout: int = 3600, date_field: str = "date", local_timeout: float = LOCAL_CACHE_TTL, stale_timeout: int | None = None
+):
+    """
+    Cache a date-range query so any range contained in a cached one is served from it.
+
+    The decorated function must take `start_date`, `end_date` and `limit`
+    arguments and return a list of models carrying `date_field`. Per set of
+    remaining arguments (e.g. the ticker) an index of cached ranges is kept;
+    a request whose [start_date, end_date] lies inside one of them gets that
+    entry's items filtered to the requested dates.
+
+    An entry that hit its `limit` may be missing older items, so it is only
+    trusted from the day after its oldest item onwards.
+
+    stale_timeout works as in cache_api_response; a stale entry is refreshed
+    for its own range, not just the sub-range that was asked for.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        codec = ModelCodec(signature.return_annotation)
+        local_ttl = min(local_timeout, timeout)
+        # Serializes the read-modify-write of the range indexes, so concurrent fetches keep each other's entries
+        index_lock = threading.Lock()
+
+        def range_keys(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop("self", None)
+            arguments.pop("max_retries", None)
+            start = _day(arguments.pop("start_date"))
+            end = _day(arguments.pop("end_date"))
+            limit = arguments.pop("limit")
+
+            identity = f"{func.__name__}:{json.dumps(arguments, sort_keys=True, default=str)}"
+            index_key = "range:" + hashlib.sha256(identity.encode()).hexdigest()
+            entry_key = f"{index_key}:{start}:{end}:{limit}"
+            return start, end, limit, index_key, entry_key
+
+        def load_index(index_key):
+            index = _cache_get(index_key, f"{func.__name__}:index", local_ttl)
+            return msgpack.unpackb(index, raw=False) if index else []
+
+        def fetch_and_store(args, kwargs):
+            start, end, limit, index_key, entry_key = range_keys(args, kwargs)
             result = func(*args, **kwargs)
 
-            # Serialize the result (handle single or list of models)
-            if isinstance(result, list):
-                model_class = result[0].__class__ if result else None
-                if model_class:
-                    serialized_data = serialize_pydantic(result)
-            elif isinstance(result, BaseModel):
-                model_class = result.__class__
-                serialized_data = serialize_pydantic(result)
-            else:
-                serialized_data = serialize_pydantic(result)  # Serialize any other types
+            covered_start = start
+            if limit and len(result) >= limit:
+                # Truncated: the oldest day returned may be incomplete
+                oldest = min(_day(getattr(item, date_field)) for item in result)
+                covered_start = (date.fromisoformat(oldest) + timedelta(days=1)).isoformat()
 
-            # Cache the serialized data in Redis with the generated key
-            redis_client.setex(cache_key, timeout, serialized_data)
+            data, ttl = _make_entry(codec.encode(result), timeout, stale_timeout)
+            _cache_set(entry_key, data, ttl, local_ttl)
+            with index_lock:
+                # Forget ranges whose entries have expired
+                index = load_index(index_key)
+                alive = _cache_exists([entry[4] for entry in index])
+                index = [entry for entry, exists in zip(index, alive) if exists and entry[4] != entry_key]
+                index.append([start, covered_start, end, limit, entry_key])
+                _cache_set(index_key, msgpack.packb(index[-RANGE_INDEX_SIZE:], use_bin_type=True),
+                           timeout + (stale_timeout or 0), local_ttl)
 
             return result
 
+        def refresh_entry(args, kwargs, start, end, limit):
+            # Re-fetch a cached entry's own range with the arguments of the current call
+            bound = signature.bind(*args, **kwargs)
+            bound.arguments.update(start_date=start, end_date=end, limit=limit)
+            return fetch_and_store(bound.args, bound.kwargs)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start, end, limit, index_key, entry_key = range_keys(args, kwargs)
+            index = load_index(index_key)
+
+            # Exact request first, then the narrowest cached range that contains the request
+            candidates = [entry for entry in index if entry[4] == entry_key]
+            if start is not None and end is not None:
+                candidates += sorted(
+                    (
+                        entry for entry in index
+                        if entry[4] != entry_key
+                        and entry[1] is not None and entry[1] <= start
+                        and entry[2] is not None and end <= entry[2]
+                    ),
+                    key=lambda entry: date.fromisoformat(entry[2]) - date.fromisoformat(entry[1]),
+                )
+            for entry_start, _, entry_end, entry_limit, key in candidates:
+                cached_data = _cache_get(key, func.__name__, local_ttl)
+                if not cached_data:
+                    continue
+                payload, stale = _open_entry(cached_data)
+                try:
+                    items = codec.decode(payload)
+                except CacheDecompressionError as e:
+                    logger.warning("Ignoring unreadable cache entry for %s: %s", func.__name__, e)
+                    continue
+                if stale:
+                    _schedule_refresh(
+                        key, lambda: refresh_entry(args, kwargs, entry_start, entry_end, entry_limit)
+                    )
+                if key != entry_key:
+                    items = [item for item in items if start <= _day(getattr(item, date_field)) <= end]
+                    if limit:
+                        items = items[:limit]
+                return items
+
+            return fetch_and_store(args, kwargs)
+
+        # Used by warm_cache: the exact entry, plus the index that sub-range lookups start from
+        wrapper.cache_keys = lambda *args, **kwargs: list(reversed(range_keys(args, kwargs)[3:]))
+        wrapper.local_ttl = local_ttl
         return wrapper
     return decorator
@@ -0,0 +1,234 @@
+"""Storage backends for the API response cache (Redis, SQLite on local disk, in-process memory)."""
+
+import os
+import sqlite3
+import threading
+import time
+
+import redis
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Which backend utils.cache stores entries in: redis, sqlite, memory or none
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis").lower()
+# Database file of the sqlite backend
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join(".cache", "api_cache.sqlite"))
+# Bytes of the sqlite database that are memory-mapped for reads
+CACHE_SQLITE_MMAP_SIZE = int(os.getenv("CACHE_SQLITE_MMAP_SIZE", str(1024 * 1024 * 1024)))
+# Seconds to stop using Redis after it failed, so an absent server does not stall every call
+REDIS_RETRY_AFTER = float(os.getenv("REDIS_RETRY_AFTER", "30"))
+
+
+class CacheBackend:
+    """Byte-string key/value store with per-entry expiry."""
+
+    name = "base"
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, data: bytes, timeout: int):
+        raise NotImplementedError
+
+    def exists_many(self, keys: list[str]) -> list[bool]:
+        return [data is not None for data in self.get_many(keys)]
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items: dict[str, tuple[bytes, int]]):
+        """Store {key: (data, timeout)}."""
+        for key, (data, timeout) in items.items():
+            self.set(key, data, timeout)
+
+
+class NullBackend(CacheBackend):
+    """Caches nothing; every call goes to the API."""
+
+    name = "none"
+
+    def get(self, key: str) -> bytes | None:
+        return None
+
+    def set(self, key: str, data: bytes, timeout: int):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """Entries kept in a dict for the lifetime of the process."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._entries: dict[str, tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, data: bytes, timeout: int):
+        with self._lock:
+            self._entries[key] = (time.time() + timeout, data)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Entries in Redis, shared by every process that talks to the same server.
+
+    Redis errors never reach the caller: the failing lookup counts as a miss,
+    and Redis is left alone for REDIS_RETRY_AFTER seconds before it is tried again.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: redis.Redis, retry_after: float = REDIS_RETRY_AFTER):
+        self.client = client
+        self.retry_after = retry_after
+        self._down_until = 0.0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self, e: Exception):
+        logger.warning("Redis cache unavailable, skipping it for %.0fs: %s", self.retry_after, e)
+        self._down_until = time.monotonic() + self.retry_after
+
+    def get(self, key: str) -> bytes | None:
+        if not self._available():
+            return None
+        try:
+            return self.client.get(key)
+        except redis.exceptions.RedisError as e:
+            self._failed(e)
+            return None
+
+    def set(self, key: str, data: bytes, timeout: int):
+        if not self._available():
+            return
+        try:
+            self.client.setex(key, timeout, data)
+        except redis.exceptions.RedisError as e:
+            self._failed(e)
+
+    def exists_many(self, keys: list[str]) -> list[bool]:
+        if not keys or not self._available():
+            return [False] * len(keys)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.exists(key)
+            return [bool(alive) for alive in pipe.execute()]
+        except redis.exceptions.RedisError as e:
+            self._failed(e)
+            return [False] * len(keys)
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys or not self._available():
+            return [None] * len(keys)
+        try:
+            return self.client.mget(keys)
+        except redis.exceptions.RedisError as e:
+            self._failed(e)
+            return [None] * len(keys)
+
+    def set_many(self, items: dict[str, tuple[bytes, int]]):
+        if not items or not self._available():
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, (data, timeout) in items.items():
+                pipe.setex(key, timeout, data)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            self._failed(e)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Entries in a local SQLite file: persistent across runs, no server needed.
+
+    The database is opened in WAL mode so several processes on one box can
+    share it, and with mmap_size set so reads come straight from the page
+    cache instead of going through read() calls.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, mmap_size: int = CACHE_SQLITE_MMAP_SIZE):
+        self.path = path
+        self.mmap_size = mmap_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, data: bytes, timeout: int):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, data, time.time() + timeout),
+            )
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        conn = self._connection()
+        now = time.time()
+        found = {}
+        # Stay below SQLite's limit on the number of bound parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?", (*chunk, now)
+            ).fetchall())
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: dict[str, tuple[bytes, int]]):
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, data, now + timeout) for key, (data, timeout) in items.items()],
+            )
+
+
+def create_cache_backend(name: str, redis_client: redis.Redis) -> CacheBackend:
+    """Build the backend called `name` (see CACHE_BACKEND)."""
+    if name == "redis":
+        return RedisBackend(redis_client)
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "memory":
+        return MemoryBackend()
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r}, expected redis, sqlite, memory or none")
@@ -0,0 +1,210 @@
+"""Optional zstd compression of cached payloads, with a trained dictionary per model type."""
+
+import os
+import struct
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, see CACHE_COMPRESSION
+    zstandard = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Set to "zstd" to compress cached payloads (needs the zstandard package)
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "").lower()
+# Payloads smaller than this are stored as they are
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+# Size of the trained dictionaries and the number of payloads they are trained on
+ZSTD_DICT_SIZE = int(os.getenv("ZSTD_DICT_SIZE", str(16 * 1024)))
+ZSTD_DICT_SAMPLES = int(os.getenv("ZSTD_DICT_SAMPLES", "32"))
+
+# Dictionaries are shared through the cache backend for a year; entries
+# referencing a dictionary that is gone are treated as cache misses.
+DICT_TIMEOUT = 365 * 24 * 3600
+
+# Compressed payloads start with this marker (0xc1 is never used by msgpack)
+# followed by the id of the dictionary they were compressed with (0 = none).
+_MAGIC = b"\xc1zst"
+_HEADER = struct.Struct("<I")
+
+
+class CacheDecompressionError(Exception):
+    """A compressed payload could not be restored, e.g. because its dictionary is gone."""
+
+
+class ZstdCompression:
+    """
+    Compress cache payloads with zstd, using one trained dictionary per model type.
+
+    The first ZSTD_DICT_SAMPLES payloads of a type are compressed without a
+    dictionary and kept as training samples. Once there are enough, a
+    dictionary is trained and stored in the cache backend, where other
+    processes pick it up instead of training their own.
+    """
+
+    def __init__(self, backend, level: int = ZSTD_LEVEL, min_bytes: int = CACHE_COMPRESS_MIN_BYTES):
+        self.backend = backend
+        self.level = level
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dicts_by_name: dict[str, "zstandard.ZstdCompressionDict"] = {}
+        self._dicts_by_id: dict[int, "zstandard.ZstdCompressionDict"] = {}
+        self._samples: dict[str, list[bytes]] = {}
+        self._looked_up: set[str] = set()
+        self._stats: dict[str, dict] = {}
+
+    def _record(self, name: str, **counters):
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                "compressed": 0, "raw_bytes": 0, "stored_bytes": 0,
+                "decompressed": 0, "decompress_seconds": 0.0,
+            })
+            for counter, value in counters.items():
+                stats[counter] += value
+
+    def _dictionary(self, name: str):
+        """Return the dictionary for `name`, loading it from the backend or training it when possible."""
+        with self._lock:
+            dictionary = self._dicts_by_name.get(name)
+            if dictionary is not None or name in self._looked_up:
+                return dictionary
+            self._looked_up.add(name)
+
+        dict_id = self.backend.get(f"zstd-dict:name:{name}")
+        if dict_id:
+            dictionary = self._load(int(dict_id))
+            if dictionary is not None:
+                with self._lock:
+                    self._dicts_by_name[name] = dictionary
+        return dictionary
+
+    def _load(self, dict_id: int):
+        with self._lock:
+            dictionary = self._dicts_by_id.get(dict_id)
+        if dictionary is not None:
+            return dictionary
+        data = self.backend.get(f"zstd-dict:id:{dict_id}")
+        if not data:
+            return None
+        dictionary = zstandard.ZstdCompressionDict(data)
+        with self._lock:
+            self._dicts_by_id[dict_id] = dictionary
+        return dictionary
+
+    def _add_sample(self, name: str, data: bytes):
+        with self._lock:
+            samples = self._samples.setdefault(name, [])
+            samples.append(data)
+            if len(samples) < ZSTD_DICT_SAMPLES:
+                return
+            del self._samples[name]
+
+        try:
+            dictionary = zstandard.train_dictionary(ZSTD_DICT_SIZE, samples, level=self.level)
+        except zstandard.ZstdError as e:
+            logger.debug("Could not train a zstd dictionary for %s: %s", name, e)
+            return
+        dict_id = dictionary.dict_id()
+        self.backend.set(f"zstd-dict:id:{dict_id}", dictionary.as_bytes(), DICT_TIMEOUT)
+        self.backend.set(f"zstd-dict:name:{name}", str(dict_id).encode(), DICT_TIMEOUT)
+        with self._lock:
+            self._dicts_by_id[dict_id] = dictionary
+            self._dicts_by_name[name] = dictionary
+        logger.debug("Trained zstd dictionary %d for %s on %d samples", dict_id, name, len(samples))
+
+    def _compressor(self, dictionary):
+        # Compressor objects are not thread-safe, so keep one per thread and dictionary
+        compressors = self._local.__dict__.setdefault("compressors", {})
+        key = dictionary.dict_id() if dictionary is not None else 0
+        compressor = compressors.get(key)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            compressors[key] = compressor
+        return compressor
+
+    def _decompressor(self, dictionary):
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        key = dictionary.dict_id() if dictionary is not None else 0
+        decompressor = decompressors.get(key)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+            decompressors[key] = decompressor
+        return decompressor
+
+    def compress(self, name: str, data: bytes) -> bytes:
+        if len(data) < self.min_bytes:
+            return data
+        dictionary = self._dictionary(name)
+        if dictionary is None:
+            self._add_sample(name, data)
+        compressed = self._compressor(dictionary).compress(data)
+        dict_id = dictionary.dict_id() if dictionary is not None else 0
+        self._record(name, compressed=1, raw_bytes=len(data), stored_bytes=len(compressed) + 8)
+        return _MAGIC + _HEADER.pack(dict_id) + compressed
+
+    def decompress(self, name: str, data: bytes) -> bytes:
+        if not data.startswith(_MAGIC):
+            return data
+        start = time.perf_counter()
+        (dict_id,) = _HEADER.unpack_from(data, len(_MAGIC))
+        dictionary = None
+        if dict_id:
+            dictionary = self._load(dict_id)
+            if dictionary is None:
+                raise CacheDecompressionError(f"zstd dictionary {dict_id} is no longer available")
+        try:
+            raw = self._decompressor(dictionary).decompress(data[len(_MAGIC) + _HEADER.size:])
+        except zstandard.ZstdError as e:
+            raise CacheDecompressionError(str(e)) from e
+        self._record(name, decompressed=1, decompress_seconds=time.perf_counter() - start)
+        return raw
+
+    def stats(self) -> dict[str, dict]:
+        """Per model type: payloads compressed, bytes before/after, and time spent decompressing on hits."""
+        with self._lock:
+            stats = {}
+            for name, counters in self._stats.items():
+                ratio = counters["raw_bytes"] / counters["stored_bytes"] if counters["stored_bytes"] else 0.0
+                per_hit = counters["decompress_seconds"] / counters["decompressed"] if counters["decompressed"] else 0.0
+                stats[name] = {
+                    **counters,
+                    "decompress_seconds": round(counters["decompress_seconds"], 4),
+                    "ratio": round(ratio, 2),
+                    "decompress_ms_per_hit": round(per_hit * 1000, 3),
+                }
+            return stats
+
+
+class NoCompression:
+    """Stores payloads as they are, but can still read payloads compressed by an earlier configuration."""
+
+    def __init__(self, backend):
+        self._zstd = ZstdCompression(backend) if zstandard is not None else None
+
+    def compress(self, name: str, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, name: str, data: bytes) -> bytes:
+        if not data.startswith(_MAGIC):
+            return data
+        if self._zstd is None:
+            raise CacheDecompressionError("payload is zstd-compressed but zstandard is not installed")
+        return self._zstd.decompress(name, data)
+
+    def stats(self) -> dict[str, dict]:
+        return self._zstd.stats() if self._zstd is not None else {}
+
+
+def create_compression(backend):
+    """Build the compression selected by CACHE_COMPRESSION."""
+    if CACHE_COMPRESSION == "zstd":
+        if zstandard is None:
+            logger.warning("CACHE_COMPRESSION=zstd but the zstandard package is not installed, storing payloads uncompressed")
+        else:
+            return ZstdCompression(backend)
+    return NoCompression(backend)
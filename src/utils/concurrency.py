@@ -0,0 +1,101 @@
+"""Shared worker pool and per-provider concurrency limits."""
+
+import os
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Default number of (analyst, ticker) pairs that may run at the same time.
+# 1 keeps the original serial behaviour.
+DEFAULT_MAX_WORKERS = int(os.getenv("ANALYST_MAX_WORKERS", "1"))
+
+# Default number of in-flight LLM calls per provider.  Override with
+# <PROVIDER>_MAX_CONCURRENCY, e.g. OPENAI_MAX_CONCURRENCY=16.
+DEFAULT_PROVIDER_CONCURRENCY = {
+    "OpenAI": 8,
+    "Anthropic": 4,
+    "Groq": 2,
+    "Ollama": 1,
+}
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+_provider_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_provider_lock = threading.Lock()
+# Share of the provider limits this process may use, see set_provider_share
+_provider_share = 1.0
+
+
+def get_worker_pool(max_workers: int = DEFAULT_MAX_WORKERS) -> ThreadPoolExecutor:
+    """
+    Return the process-wide worker pool, (re)creating it when the requested size changes.
+
+    All analysts submit their per-ticker work to this single pool, so the total
+    number of concurrent (analyst, ticker) pairs never exceeds max_workers.
+    """
+    global _pool, _pool_size
+    max_workers = max(1, int(max_workers))
+    with _pool_lock:
+        if _pool is None or _pool_size != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            logger.debug("Creating analyst worker pool with %d workers", max_workers)
+            _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyst")
+            _pool_size = max_workers
+        return _pool
+
+
+def set_provider_share(share: float):
+    """
+    Let this process use only `share` of each provider's concurrency cap (at least one slot).
+
+    The caps are per process, so when N processes call the same providers side by
+    side (e.g. backtest signal workers) each of them sets a share of 1/N.
+    """
+    global _provider_share
+    with _provider_lock:
+        _provider_share = share
+        _provider_semaphores.clear()
+
+
+def get_provider_limit(provider: str) -> int:
+    """Return the concurrency cap for a provider, honouring <PROVIDER>_MAX_CONCURRENCY."""
+    env_value = os.getenv(f"{str(provider).upper()}_MAX_CONCURRENCY")
+    limit = int(env_value) if env_value else DEFAULT_PROVIDER_CONCURRENCY.get(str(provider), 4)
+    return max(1, int(limit * _provider_share))
+
+
+def provider_semaphore(provider: str) -> threading.BoundedSemaphore:
+    """The semaphore behind provider_slot, for slots that are released by another thread."""
+    provider = getattr(provider, "value", provider)
+    with _provider_lock:
+        semaphore = _provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(get_provider_limit(provider))
+            _provider_semaphores[provider] = semaphore
+        return semaphore
+
+
+@contextmanager
+def provider_slot(provider: str):
+    """Block until a concurrency slot for `provider` is free, release it on exit."""
+    with provider_semaphore(provider):
+        yield
+
+
+@asynccontextmanager
+async def async_provider_slot(provider: str, poll_interval: float = 0.05):
+    """Async version of provider_slot: waits for the same slots without blocking the event loop."""
+    semaphore = provider_semaphore(provider)
+    while not semaphore.acquire(blocking=False):
+        await asyncio.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        semaphore.release()
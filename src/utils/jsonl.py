@@ -0,0 +1,50 @@
+"""Append-only JSON Lines files, used as checkpoints of long runs."""
+
+import hashlib
+import json
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def jsonl_path(root: str, identity: dict) -> str:
+    """Path of the file under `root` for a run described by `identity`, so identical runs share it."""
+    key = json.dumps(identity, sort_keys=True, default=str)
+    return os.path.join(root, hashlib.sha256(key.encode()).hexdigest()[:16] + ".jsonl")
+
+
+def _json_default(value):
+    # numpy scalars from the agents' calculations
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def read_jsonl(path: str) -> list[dict]:
+    """All records of the file; a line torn by a crash is skipped."""
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning("Skipping unreadable line in %s", path)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def append_jsonl(path: str, record: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, default=_json_default) + "\n"
+    with open(path, "a+b") as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # Start a fresh line after one torn by an earlier crash
+                line = "\n" + line
+        f.write(line.encode("utf-8"))
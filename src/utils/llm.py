@@ -1,12 +1,267 @@
 """Helper functions for LLM"""
 
+import os
 import json
-from typing import TypeVar, Type, Optional, Any
-from pydantic import BaseModel
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import TypeVar, Type, Optional, Any, Callable
+from pydantic import BaseModel, ValidationError, create_model
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
 from utils.progress import progress
+from utils.concurrency import provider_semaphore, async_provider_slot
+from utils.cache import get_cached, set_cached
+
+import logging
+logger = logging.getLogger(__name__)
 
 T = TypeVar('T', bound=BaseModel)
 
+# Replay parsed LLM responses for prompts that were answered before
+LLM_CACHE = os.getenv("LLM_CACHE", "false").lower() == "true"
+# Seconds a cached LLM response is kept (default 30 days)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+# Seconds one LLM request may take before it is given up on and retried; 0 disables the limit
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "120"))
+# Retry backoff: a random delay of up to base * 2**attempt seconds, capped at the maximum
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+# Most tickers asked for in one batched persona call; larger batches are split and sent concurrently
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+# Wall-clock seconds the LLM calls of one hedge fund run may take; once spent, calls
+# return their default response instead of stalling the run. 0 means no budget.
+LLM_RUN_BUDGET_SECONDS = float(os.getenv("LLM_RUN_BUDGET_SECONDS", "0"))
+
+_run_deadline: Optional[float] = None
+_pool = None
+_pool_lock = threading.Lock()
+_loop = None
+_runnables: dict[tuple, tuple[Any, bool]] = {}
+_runnables_lock = threading.Lock()
+_usage: dict[str, dict] = {}
+_usage_lock = threading.Lock()
+
+
+def _prompt_messages(prompt: Any) -> list:
+    """Reduce a prompt (PromptValue, message list or string) to plain [role, content] pairs."""
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, str):
+        return [["human", prompt]]
+    return [
+        [message.type, message.content] if hasattr(message, "type") else list(message)
+        for message in prompt
+    ]
+
+
+def llm_cache_key(prompt: Any, model_name: str, model_provider: str, pydantic_model: Type[BaseModel]) -> str:
+    """Content address of an LLM call: the prompt messages, the model and the output schema."""
+    content = json.dumps(
+        {
+            "messages": _prompt_messages(prompt),
+            "model": model_name,
+            "provider": str(getattr(model_provider, "value", model_provider)),
+            "schema": pydantic_model.model_json_schema(),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return "llm:" + hashlib.sha256(content.encode()).hexdigest()
+
+
+def start_llm_budget(seconds: float = LLM_RUN_BUDGET_SECONDS):
+    """Start the time budget of a run; 0 or less means LLM calls are not limited."""
+    global _run_deadline
+    _run_deadline = time.monotonic() + seconds if seconds > 0 else None
+
+
+def stop_llm_budget():
+    global _run_deadline
+    _run_deadline = None
+
+
+def _attempt_timeout(timeout: Optional[float]) -> Optional[float]:
+    """Seconds the next attempt may take (None = no limit); 0 once the run budget is spent."""
+    remaining = None if _run_deadline is None else max(0.0, _run_deadline - time.monotonic())
+    if not timeout:
+        return remaining
+    return timeout if remaining is None else min(timeout, remaining)
+
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, never sleeping past the run budget."""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    remaining = _attempt_timeout(None)
+    return delay if remaining is None else min(delay, remaining)
+
+
+def _budget_exhausted(timeout: Optional[float], agent_name: Optional[str]) -> bool:
+    if timeout is None or timeout > 0:
+        return False
+    logger.warning("LLM run budget exhausted, using the default response%s", f" for {agent_name}" if agent_name else "")
+    if agent_name:
+        progress.update_status(agent_name, None, "LLM budget exhausted")
+    return True
+
+
+def _cached_response(cache_key: Optional[str], model_name: str, pydantic_model: Type[T]) -> Optional[T]:
+    if not cache_key:
+        return None
+    # Hits and misses are counted per LLM in the cache stats
+    cached = get_cached(cache_key, f"llm:{model_name}")
+    if cached:
+        try:
+            return pydantic_model.model_validate_json(cached)
+        except ValidationError as e:
+            logger.warning("Ignoring unreadable cached LLM response: %s", e)
+    return None
+
+
+def _structured_llm(model_name: str, model_provider: str, pydantic_model: Type[T]) -> tuple[Any, bool]:
+    """
+    Return the runnable to call and whether it is a Deepseek model, whose JSON is parsed by hand.
+
+    Runnables are built once per (provider, model, output schema) and shared
+    by all calls and threads, so their HTTP connection pool is reused too.
+    """
+    from llm.models import get_cached_model, get_model_info
+
+    key = (str(getattr(model_provider, "value", model_provider)), model_name, pydantic_model)
+    with _runnables_lock:
+        runnable = _runnables.get(key)
+        if runnable is not None:
+            return runnable
+
+        model_info = get_model_info(model_name)
+        # The client enforces LLM_CALL_TIMEOUT itself; retries are left to call_llm
+        llm = get_cached_model(model_name, model_provider, request_timeout=LLM_CALL_TIMEOUT or None)
+        is_deepseek = bool(model_info and model_info.is_deepseek())
+
+        # For non-Deepseek models, we can use structured output
+        if not is_deepseek:
+            # include_raw keeps the AIMessage, whose usage metadata has the cached-token counts
+            llm = llm.with_structured_output(
+                pydantic_model,
+                method="json_mode",
+                include_raw=True,
+            )
+        _runnables[key] = (llm, is_deepseek)
+        return llm, is_deepseek
+
+
+def _parse_result(result: Any, pydantic_model: Type[T], is_deepseek: bool) -> tuple[T, Any]:
+    """Return the parsed answer and the raw AIMessage it came from."""
+    # For Deepseek, we need to extract and parse the JSON manually
+    if is_deepseek:
+        parsed_result = extract_json_from_deepseek_response(result.content)
+        if not parsed_result:
+            raise ValueError("No JSON found in Deepseek response")
+        return pydantic_model(**parsed_result), result
+    # include_raw gives {"raw", "parsed", "parsing_error"}; anything else is taken as the answer itself
+    if not isinstance(result, dict):
+        if not isinstance(result, pydantic_model):
+            raise ValueError(f"LLM returned {type(result).__name__} instead of {pydantic_model.__name__}")
+        return result, None
+    if result.get("parsing_error"):
+        raise result["parsing_error"]
+    if result.get("parsed") is None:
+        raise ValueError("LLM returned no structured output")
+    return result["parsed"], result.get("raw")
+
+
+def _cacheable_prompt(prompt: Any, model_provider: str) -> Any:
+    """
+    Mark the end of the system message as a prompt-cache breakpoint for Anthropic.
+
+    The analyst prompts keep their static instructions in the system message
+    and only the per-ticker data in the human message, so that prefix is the
+    same across tickers and days. OpenAI caches such shared prefixes without
+    being asked; Anthropic only caches up to an explicit cache_control marker.
+    Both skip prefixes shorter than their minimum (1024 tokens, 2048 for
+    Claude Haiku), so the marker only pays off once the system prompt grows
+    past it; the cached-token counts in get_llm_usage_stats show whether it does.
+    """
+    if str(getattr(model_provider, "value", model_provider)) != "Anthropic":
+        return prompt
+    messages = prompt.to_messages() if hasattr(prompt, "to_messages") else prompt
+    if not isinstance(messages, list):
+        return prompt
+    return [
+        SystemMessage(content=[{"type": "text", "text": message.content, "cache_control": {"type": "ephemeral"}}])
+        if isinstance(message, SystemMessage) and isinstance(message.content, str) else message
+        for message in messages
+    ]
+
+
+def _record_usage(model_name: str, model_provider: str, agent_name: Optional[str], message: Any):
+    """Add the token counts of one call, including those served from the provider's prompt cache."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    details = usage.get("input_token_details") or {}
+    cache_read = details.get("cache_read") or 0
+    cache_creation = details.get("cache_creation") or 0
+    logger.debug(
+        "LLM call%s: %d input tokens (%d from prompt cache, %d written to it), %d output tokens",
+        f" by {agent_name}" if agent_name else "",
+        usage.get("input_tokens", 0), cache_read, cache_creation, usage.get("output_tokens", 0),
+    )
+    key = f"{getattr(model_provider, 'value', model_provider)}:{model_name}"
+    with _usage_lock:
+        stats = _usage.setdefault(key, {
+            "calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "cache_creation_tokens": 0, "output_tokens": 0,
+        })
+        stats["calls"] += 1
+        stats["input_tokens"] += usage.get("input_tokens", 0)
+        stats["cached_input_tokens"] += cache_read
+        stats["cache_creation_tokens"] += cache_creation
+        stats["output_tokens"] += usage.get("output_tokens", 0)
+
+
+def get_llm_usage_stats() -> dict[str, dict]:
+    """Token counts per provider:model, with the share of input tokens read from the prompt cache."""
+    with _usage_lock:
+        return {
+            key: {
+                **stats,
+                "cached_ratio": round(stats["cached_input_tokens"] / stats["input_tokens"], 3) if stats["input_tokens"] else 0.0,
+            }
+            for key, stats in _usage.items()
+        }
+
+
+def _call_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm")
+        return _pool
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """The event loop of all async LLM calls, on its own thread, so the models' async clients stay bound to one loop."""
+    global _loop
+    with _pool_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-async", daemon=True).start()
+        return _loop
+
+
+def run_async(coro):
+    """Run a coroutine on the shared LLM event loop from synchronous code and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+
+async def _gather(awaitables) -> list:
+    return await asyncio.gather(*awaitables)
+
+
 def call_llm(
     prompt: Any,
     model_name: str,
@@ -14,10 +269,14 @@ def call_llm(
     pydantic_model: Type[T],
     agent_name: Optional[str] = None,
     max_retries: int = 3,
-    default_factory = None
+    default_factory = None,
+    timeout: Optional[float] = LLM_CALL_TIMEOUT,
 ) -> T:
     """
     Makes an LLM call with retry logic, handling both Deepseek and non-Deepseek models.
+
+    Each attempt is abandoned after `timeout` seconds (or when the run budget
+    runs out), and retries back off exponentially with jitter.
     
     Args:
         prompt: The prompt to send to the LLM
@@ -27,35 +286,46 @@ def call_llm(
         agent_name: Optional name of the agent for progress updates
         max_retries: Maximum number of retries (default: 3)
         default_factory: Optional factory function to create default response on failure
+        timeout: Seconds one attempt may take, None for no limit (default: LLM_CALL_TIMEOUT)
         
     Returns:
         An instance of the specified Pydantic model
     """
-    from llm.models import get_model, get_model_info
-    
-    model_info = get_model_info(model_name)
-    llm = get_model(model_name, model_provider)
-    
-    # For non-Deepseek models, we can use structured output
-    if not (model_info and model_info.is_deepseek()):
-        llm = llm.with_structured_output(
-            pydantic_model,
-            method="json_mode",
-        )
-    
+    cache_key = llm_cache_key(prompt, model_name, model_provider, pydantic_model) if LLM_CACHE else None
+    cached = _cached_response(cache_key, model_name, pydantic_model)
+    if cached is not None:
+        return cached
+
+    llm, is_deepseek = _structured_llm(model_name, model_provider, pydantic_model)
+
+    slots = provider_semaphore(model_provider)
+
     # Call the LLM with retries
     for attempt in range(max_retries):
         try:
-            # Call the LLM
-            result = llm.invoke(prompt)
-            
-            # For Deepseek, we need to extract and parse the JSON manually
-            if model_info and model_info.is_deepseek():
-                parsed_result = extract_json_from_deepseek_response(result.content)
-                if parsed_result:
-                    return pydantic_model(**parsed_result)
-            else:
-                return result
+            # Call the LLM, respecting the per-provider concurrency cap. The call runs on
+            # a helper thread so a hung request can be given up on before the client's own
+            # timeout (e.g. when the run budget runs out). That thread keeps the slot until
+            # the request has finished, so abandoned requests still count against the cap.
+            slots.acquire()
+            # The budget is checked once the slot is ours, as waiting for it may take a while
+            attempt_timeout = _attempt_timeout(timeout)
+            if _budget_exhausted(attempt_timeout, agent_name):
+                slots.release()
+                break
+            future = _call_pool().submit(llm.invoke, _cacheable_prompt(prompt, model_provider))
+            future.add_done_callback(lambda _: slots.release())
+            try:
+                result = future.result(timeout=attempt_timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(f"LLM call timed out after {attempt_timeout:.1f}s") from None
+            result, raw = _parse_result(result, pydantic_model, is_deepseek)
+            _record_usage(model_name, model_provider, agent_name, raw)
+
+            # Only real answers are cached, never the defaults used after failures
+            if cache_key and result is not None:
+                set_cached(cache_key, result.model_dump_json().encode(), LLM_CACHE_TTL)
+            return result
                 
         except Exception as e:
             if agent_name:
@@ -63,14 +333,161 @@ def call_llm(
             
             if attempt == max_retries - 1:
                 print(f"Error in LLM call after {max_retries} attempts: {e}")
-                # Use default_factory if provided, otherwise create a basic default
-                if default_factory:
-                    return default_factory()
-                return create_default_response(pydantic_model)
+                break
+            time.sleep(_retry_delay(attempt))
 
-    # This should never be reached due to the retry logic above
+    # Use default_factory if provided, otherwise create a basic default
+    if default_factory:
+        return default_factory()
     return create_default_response(pydantic_model)
 
+
+async def acall_llm(
+    prompt: Any,
+    model_name: str,
+    model_provider: str,
+    pydantic_model: Type[T],
+    agent_name: Optional[str] = None,
+    max_retries: int = 3,
+    default_factory = None,
+    timeout: Optional[float] = LLM_CALL_TIMEOUT,
+) -> T:
+    """
+    Async version of call_llm, built on the chat model's ainvoke.
+
+    A timed-out attempt is cancelled, so it gives its provider slot back, and
+    waiting for a slot or a retry does not block the event loop, so many calls
+    can run side by side (see run_async).
+    """
+    cache_key = llm_cache_key(prompt, model_name, model_provider, pydantic_model) if LLM_CACHE else None
+    cached = _cached_response(cache_key, model_name, pydantic_model)
+    if cached is not None:
+        return cached
+
+    llm, is_deepseek = _structured_llm(model_name, model_provider, pydantic_model)
+
+    for attempt in range(max_retries):
+        try:
+            async with async_provider_slot(model_provider):
+                # The budget is checked once the slot is ours, as waiting for it may take a while
+                attempt_timeout = _attempt_timeout(timeout)
+                if _budget_exhausted(attempt_timeout, agent_name):
+                    break
+                result = await asyncio.wait_for(llm.ainvoke(_cacheable_prompt(prompt, model_provider)), attempt_timeout)
+            result, raw = _parse_result(result, pydantic_model, is_deepseek)
+            _record_usage(model_name, model_provider, agent_name, raw)
+
+            # Only real answers are cached, never the defaults used after failures
+            if cache_key and result is not None:
+                set_cached(cache_key, result.model_dump_json().encode(), LLM_CACHE_TTL)
+            return result
+
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"LLM call timed out after {attempt_timeout:.1f}s")
+            if agent_name:
+                progress.update_status(agent_name, None, f"Error - retry {attempt + 1}/{max_retries}")
+
+            if attempt == max_retries - 1:
+                print(f"Error in LLM call after {max_retries} attempts: {e}")
+                break
+            await asyncio.sleep(_retry_delay(attempt))
+
+    if default_factory:
+        return default_factory()
+    return create_default_response(pydantic_model)
+
+
+# The batch instructions go after the agent's system prompt, the tickers and their data in the human message
+BATCH_SYSTEM_PROMPT = """
+Based on the analysis data in the next message, create an investment signal for each of its tickers.
+
+Return JSON in this format, with exactly one entry per ticker:
+{{
+  "signals": {{
+    "<TICKER>": {{
+      "signal": "bullish/bearish/neutral",
+      "confidence": float (0-100),
+      "reasoning": "string"
+    }}
+  }}
+}}
+"""
+
+BATCH_HUMAN_PROMPT = """Tickers: {tickers}
+
+Analysis Data by ticker:
+{analysis_data}
+"""
+
+
+@lru_cache(maxsize=None)
+def batch_model(signal_model: Type[T]) -> Type[BaseModel]:
+    """Output schema of a batched call: {"signals": {ticker: signal_model}}."""
+    return create_model(f"{signal_model.__name__}Batch", signals=(dict[str, signal_model], ...))
+
+
+def generate_signals_batched(
+    tickers: list[str],
+    analysis_data: dict[str, Any],
+    system_prompt: str,
+    signal_model: Type[T],
+    agent_name: str,
+    model_name: str,
+    model_provider: str,
+    generate_one: Callable[..., T],
+) -> dict[str, T]:
+    """
+    Ask for the signals of all tickers in as few LLM calls as possible.
+
+    Tickers are sent in batches of up to LLM_BATCH_SIZE, all batches
+    concurrently through acall_llm. Tickers missing from the answers, or a
+    whole batch whose answer does not validate, are retried one by one with
+    generate_one (the agent's regular per-ticker generator), so the result
+    always covers every ticker.
+    """
+    signals = {}
+    if len(tickers) > 1:
+        for ticker in tickers:
+            progress.update_status(agent_name, ticker, "Generating batched analysis")
+        template = ChatPromptTemplate.from_messages([
+            ("system", system_prompt + BATCH_SYSTEM_PROMPT),
+            ("human", BATCH_HUMAN_PROMPT),
+        ])
+        batches = [tickers[i:i + LLM_BATCH_SIZE] for i in range(0, len(tickers), LLM_BATCH_SIZE)]
+        calls = [
+            acall_llm(
+                prompt=template.invoke({
+                    "tickers": ", ".join(batch),
+                    "analysis_data": json.dumps({ticker: analysis_data[ticker] for ticker in batch}, indent=2),
+                }),
+                model_name=model_name,
+                model_provider=model_provider,
+                pydantic_model=batch_model(signal_model),
+                agent_name=agent_name,
+                max_retries=2,
+                default_factory=lambda: None,
+            )
+            for batch in batches
+        ]
+        for batch, result in zip(batches, run_async(_gather(calls))):
+            if result is not None:
+                signals.update({ticker: result.signals[ticker] for ticker in batch if ticker in result.signals})
+
+    missing = [ticker for ticker in tickers if ticker not in signals]
+    if len(tickers) > 1 and missing:
+        logger.warning("%s: batched LLM call did not cover %s, falling back to per-ticker calls", agent_name, missing)
+    for ticker in missing:
+        progress.update_status(agent_name, ticker, "Generating analysis")
+        signals[ticker] = generate_one(
+            ticker=ticker,
+            analysis_data={ticker: analysis_data[ticker]},
+            model_name=model_name,
+            model_provider=model_provider,
+        )
+    return signals
+
+
 def create_default_response(model_class: Type[T]) -> T:
     """Creates a safe default response based on the model's fields."""
     default_values = {}
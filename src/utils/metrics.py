@@ -0,0 +1,82 @@
+"""Backtest performance metrics (Sharpe, Sortino, max drawdown) updated one portfolio value at a time."""
+
+import math
+
+# Annual risk-free rate and trading days per year used for the ratios
+RISK_FREE_RATE = 0.0434
+TRADING_DAYS = 252
+
+
+class _Welford:
+    """Running count, mean and sum of squared deviations (Welford's algorithm)."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, as pandas); NaN below two values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+
+class OnlinePerformanceMetrics:
+    """
+    Sharpe ratio, Sortino ratio and maximum drawdown of a series of portfolio values.
+
+    Each `add` is O(1): daily excess returns feed a running mean/variance,
+    the negative ones a second running variance for the downside deviation,
+    and a running peak gives the drawdown. The results equal the pandas
+    computation over the whole series (pct_change, std, cummax) that the
+    backtester used to redo every day; see tests/test_metrics.py.
+    """
+
+    def __init__(self, risk_free_rate: float = RISK_FREE_RATE, periods_per_year: int = TRADING_DAYS):
+        self.periods_per_year = periods_per_year
+        self.period_risk_free_rate = risk_free_rate / periods_per_year
+        self._last = None
+        self._excess = _Welford()
+        self._downside = _Welford()
+        self._peak = -math.inf
+        self._max_drawdown = 0.0
+
+    def add(self, value: float):
+        if self._last is not None:
+            excess = value / self._last - 1 - self.period_risk_free_rate
+            self._excess.add(excess)
+            if excess < 0:
+                self._downside.add(excess)
+        self._last = value
+        self._peak = max(self._peak, value)
+        self._max_drawdown = min(self._max_drawdown, (value - self._peak) / self._peak)
+
+    def update(self, performance_metrics: dict):
+        """Write sharpe_ratio, sortino_ratio and max_drawdown (in %) into `performance_metrics`; nothing before two returns."""
+        if self._excess.count < 2:
+            return
+        annualization = math.sqrt(self.periods_per_year)
+        mean_excess_return = self._excess.mean
+        std_excess_return = self._excess.std()
+
+        if std_excess_return > 1e-12:
+            performance_metrics["sharpe_ratio"] = annualization * (mean_excess_return / std_excess_return)
+        else:
+            performance_metrics["sharpe_ratio"] = 0.0
+
+        # Like pandas, the downside deviation of fewer than two negative returns is undefined
+        downside_std = self._downside.std()
+        if downside_std > 1e-12:
+            performance_metrics["sortino_ratio"] = annualization * (mean_excess_return / downside_std)
+        else:
+            performance_metrics["sortino_ratio"] = float("inf") if mean_excess_return > 0 else 0
+
+        performance_metrics["max_drawdown"] = self._max_drawdown * 100
+
@@ -4,6 +4,7 @@ from rich.table import Table
 from rich.style import Style
 from rich.text import Text
 from typing import Dict, Optional
+import threading
 
 console = Console()
 
@@ -16,6 +17,8 @@ class AgentProgress:
         self.table = Table(show_header=False, box=None, padding=(0, 1))
         self.live = Live(self.table, console=console, refresh_per_second=4)
         self.started = False
+        # Agents may update their status from several worker threads at once
+        self._lock = threading.Lock()
 
     def start(self):
         """Start the progress display."""
@@ -31,15 +34,16 @@ class AgentProgress:
 
     def update_status(self, agent_name: str, ticker: Optional[str] = None, status: str = ""):
         """Update the status of an agent."""
-        if agent_name not in self.agent_status:
-            self.agent_status[agent_name] = {"status": "", "ticker": None}
+        with self._lock:
+            if agent_name not in self.agent_status:
+                self.agent_status[agent_name] = {"status": "", "ticker": None}
 
-        if ticker:
-            self.agent_status[agent_name]["ticker"] = ticker
-        if status:
-            self.agent_status[agent_name]["status"] = status
+            if ticker:
+                self.agent_status[agent_name]["ticker"] = ticker
+            if status:
+                self.agent_status[agent_name]["status"] = status
 
-        self._refresh_display()
+            self._refresh_display()
 
     def _refresh_display(self):
         """Refresh the progress display."""
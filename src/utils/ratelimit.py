@@ -0,0 +1,164 @@
+"""Token-bucket rate limiting shared by all API clients (and, through Redis, all processes)."""
+
+import os
+import threading
+import time
+
+import redis
+
+from utils.cache import redis_client
+from utils.cache_backends import CACHE_BACKEND
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Requests per minute allowed per endpoint.  FINANCIAL_DATASETS_RPM sets the
+# default, FINANCIAL_DATASETS_RPM_<ENDPOINT> (e.g. _PRICES, _NEWS) overrides it.
+# 0 (or less) means no limit.
+DEFAULT_RPM = int(os.getenv("FINANCIAL_DATASETS_RPM", "300"))
+# How many seconds worth of requests may be sent in a burst.
+BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+
+# Refill the bucket for the elapsed time, then take `requested` tokens if
+# available.  Returns the number of seconds the caller has to wait (0 = go).
+# Uses the Redis server clock so all processes agree on the time.
+_ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+  tokens = tokens - requested
+else
+  wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at `rate` tokens per second up to `capacity`;
+    a rate of 0 or less never makes callers wait.
+
+    State lives in Redis so that several processes on one box share one quota.
+    If Redis cannot be reached, or the cache is not configured to use Redis
+    (CACHE_BACKEND), the bucket falls back to an in-process bucket, which only
+    gets `local_share` of the rate: other processes have buckets of their own.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, client=redis_client if CACHE_BACKEND == "redis" else None,
+                 local_share: float = 1.0):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.local_rate = rate * local_share
+        self.local_capacity = max(1.0, capacity * local_share)
+        self.key = f"ratelimit:{name}"
+        self.client = client
+        self._script = client.register_script(_ACQUIRE_SCRIPT) if client is not None else None
+        self._lock = threading.Lock()
+        self._tokens = self.local_capacity
+        self._ts = time.monotonic()
+        # Metrics
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+    def _try_acquire_local(self, tokens: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.local_capacity, self._tokens + (now - self._ts) * self.local_rate)
+            self._ts = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.local_rate
+
+    def _try_acquire(self, tokens: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        if self._script is not None:
+            try:
+                return float(self._script(keys=[self.key], args=[self.rate, self.capacity, tokens]))
+            except redis.exceptions.RedisError as e:
+                logger.warning("Rate limiter %s falling back to in-process bucket: %s", self.name, e)
+                self._script = None
+        return self._try_acquire_local(tokens)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until `tokens` are available. Returns the number of seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(tokens)
+            if delay <= 0:
+                break
+            time.sleep(delay)
+            waited += delay
+
+        with self._lock:
+            self.acquired += 1
+            if waited > 0:
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait = max(self.max_wait, waited)
+        if waited > 0:
+            logger.debug("Rate limiter %s waited %.3fs", self.name, waited)
+        return waited
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "max_wait": round(self.max_wait, 3),
+            }
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+# Share of the per-endpoint rates an in-process bucket may use, see set_rate_share
+_rate_share = 1.0
+
+
+def set_rate_share(share: float):
+    """
+    Let this process's in-process buckets use only `share` of each endpoint's rate.
+
+    Buckets kept in Redis are shared by all processes and keep the full rate;
+    without Redis (not configured, or unreachable) every process has its own
+    bucket, so N processes calling the same API side by side each set a share of 1/N.
+    """
+    global _rate_share
+    with _buckets_lock:
+        _rate_share = share
+        _buckets.clear()
+
+
+def get_rate_limiter(endpoint: str) -> TokenBucket:
+    """Return the (shared) token bucket for an API endpoint, e.g. 'prices' or 'news'."""
+    with _buckets_lock:
+        bucket = _buckets.get(endpoint)
+        if bucket is None:
+            rpm = int(os.getenv(f"FINANCIAL_DATASETS_RPM_{endpoint.upper()}", DEFAULT_RPM))
+            rate = rpm / 60.0
+            bucket = TokenBucket(endpoint, rate=rate, capacity=max(1.0, rate * BURST_SECONDS), local_share=_rate_share)
+            _buckets[endpoint] = bucket
+        return bucket
+
+
+def get_rate_limit_stats() -> dict[str, dict]:
+    """Time spent waiting on each endpoint's bucket since process start."""
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    return {bucket.name: bucket.stats() for bucket in buckets}
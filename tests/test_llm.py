@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+
+import utils.llm as llm
+
+
+class Signal(BaseModel):
+    signal: str
+    confidence: float
+
+
+class FakeModel:
+    """Structured-output runnable answering after `delay` seconds and tracking how many calls overlap."""
+
+    def __init__(self, delay: float = 0.0, answer=None):
+        self.delay = delay
+        self.answer = answer or (lambda prompt: Signal(signal="bullish", confidence=80.0))
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return {"raw": None, "parsed": self.answer(prompt), "parsing_error": None}
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(llm, "_structured_llm", lambda *args: (model, False))
+    monkeypatch.setattr(llm, "_retry_delay", lambda attempt: 0.0)
+    monkeypatch.setattr(llm, "LLM_CACHE", False)
+    return model
+
+
+def test_acall_llm_returns_parsed_answer(fake_model):
+    result = llm.run_async(llm.acall_llm("prompt", "fake-model", "FakeProvider", Signal))
+    assert result == Signal(signal="bullish", confidence=80.0)
+    assert fake_model.calls == 1
+
+
+def test_acall_llm_falls_back_after_timeouts(fake_model):
+    fake_model.delay = 1.0
+    result = llm.run_async(llm.acall_llm(
+        "prompt", "fake-model", "FakeProvider", Signal, max_retries=2, timeout=0.05,
+        default_factory=lambda: Signal(signal="neutral", confidence=0.0),
+    ))
+    assert result.signal == "neutral"
+    assert fake_model.calls == 2
+
+
+def test_acall_llm_respects_provider_limit(fake_model, monkeypatch):
+    monkeypatch.setenv("LIMITEDPROVIDER_MAX_CONCURRENCY", "2")
+    fake_model.delay = 0.05
+    calls = [llm.acall_llm(f"prompt {i}", "fake-model", "LimitedProvider", Signal) for i in range(6)]
+    results = llm.run_async(llm._gather(calls))
+    assert len(results) == 6
+    assert fake_model.max_running == 2
+
+
+def test_generate_signals_batched_runs_batches_concurrently(fake_model, monkeypatch):
+    tickers = ["AAPL", "MSFT", "NVDA", "TSLA", "GOOG"]
+    monkeypatch.setattr(llm, "LLM_BATCH_SIZE", 2)
+    monkeypatch.setenv("BATCHPROVIDER_MAX_CONCURRENCY", "4")
+    fake_model.delay = 0.05
+
+    def answer(prompt):
+        # Leave TSLA out of its batch's answer, so it goes through generate_one
+        text = prompt.to_string()
+        batch = [t for t in tickers if t in text and t != "TSLA"]
+        return llm.batch_model(Signal)(signals={t: Signal(signal="bullish", confidence=70.0) for t in batch})
+
+    fake_model.answer = answer
+    generated_one = []
+
+    def generate_one(ticker, analysis_data, model_name, model_provider):
+        generated_one.append(ticker)
+        return Signal(signal="neutral", confidence=0.0)
+
+    signals = llm.generate_signals_batched(
+        tickers, {t: {"score": 1} for t in tickers}, "system", Signal, "test_agent",
+        "fake-model", "BatchProvider", generate_one,
+    )
+    assert fake_model.calls == 3
+    assert fake_model.max_running == 3
+    assert generated_one == ["TSLA"]
+    assert signals["TSLA"].signal == "neutral"
+    assert all(signals[t].signal == "bullish" for t in tickers if t != "TSLA")
+
+
+def test_cacheable_prompt_marks_system_message_for_anthropic():
+    prompt = ChatPromptTemplate.from_messages([("system", "static"), ("human", "{data}")]).invoke({"data": "AAPL"})
+
+    system, human = llm._cacheable_prompt(prompt, "Anthropic")
+    assert isinstance(system, SystemMessage)
+    assert system.content == [{"type": "text", "text": "static", "cache_control": {"type": "ephemeral"}}]
+    assert human == HumanMessage(content="AAPL")
+    assert llm._cacheable_prompt(prompt, "OpenAI") is prompt
@@ -0,0 +1,67 @@
+import math
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.metrics import OnlinePerformanceMetrics, RISK_FREE_RATE, TRADING_DAYS
+
+
+def batch_performance_metrics(values: list[float]) -> dict:
+    """The pandas computation over the whole series that the backtester used before."""
+    metrics = {}
+    series = pd.Series(values, dtype="float64")
+    clean_returns = series.pct_change().dropna()
+    if len(clean_returns) < 2:
+        return metrics
+
+    excess_returns = clean_returns - RISK_FREE_RATE / TRADING_DAYS
+    mean_excess_return = excess_returns.mean()
+    std_excess_return = excess_returns.std()
+    if std_excess_return > 1e-12:
+        metrics["sharpe_ratio"] = np.sqrt(TRADING_DAYS) * (mean_excess_return / std_excess_return)
+    else:
+        metrics["sharpe_ratio"] = 0.0
+
+    negative_returns = excess_returns[excess_returns < 0]
+    if len(negative_returns) > 0:
+        downside_std = negative_returns.std()
+        if downside_std > 1e-12:
+            metrics["sortino_ratio"] = np.sqrt(TRADING_DAYS) * (mean_excess_return / downside_std)
+        else:
+            metrics["sortino_ratio"] = float("inf") if mean_excess_return > 0 else 0
+    else:
+        metrics["sortino_ratio"] = float("inf") if mean_excess_return > 0 else 0
+
+    rolling_max = series.cummax()
+    metrics["max_drawdown"] = ((series - rolling_max) / rolling_max).min() * 100
+    return metrics
+
+
+def _random_walk(n: int, seed: int = 42) -> list[float]:
+    rng = random.Random(seed)
+    return [100_000 * math.exp(sum(rng.gauss(0.0005, 0.01) for _ in range(i))) for i in range(n)]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        _random_walk(300),
+        [100_000 * 1.001 ** i for i in range(50)],
+        [100_000.0] * 20,
+        [100_000, 101_000, 100_500, 102_000, 103_000, 104_000],
+        [100_000, 90_000, 60_000, 65_000, 80_000, 110_000, 95_000],
+    ],
+    ids=["random walk", "only gains", "flat", "one loss", "crash and recovery"],
+)
+def test_online_metrics_match_pandas_after_every_value(values):
+    online = OnlinePerformanceMetrics()
+    for n, value in enumerate(values, start=1):
+        online.add(value)
+        online_metrics, batch_metrics = {}, batch_performance_metrics(values[:n])
+        online.update(online_metrics)
+
+        assert online_metrics.keys() == batch_metrics.keys(), n
+        for key, expected in batch_metrics.items():
+            assert online_metrics[key] == pytest.approx(float(expected), rel=1e-9, abs=1e-12), (n, key)